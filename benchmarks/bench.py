@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Times the main docker_utils operations against a fake docker daemon
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+# Run as a script from a checkout, docker_utils is not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fakedocker  # noqa: E402
+from docker_utils import bulk, catalog, client, docker_wrapper, imagegraph, index, metadata, teardown  # noqa: E402
+
+SIZES = [10, 1000]
+# Templates started by the run operation, whatever the size
+RUN_COUNT = 100
+# Names and IDs looked up by the resolve operation
+RESOLVE_COUNT = 1000
+# All a single container create may ask the daemon for: one listing to
+# resolve the name, one inspect
+CREATE_CALLS = {'GET /containers/json': 1, 'GET /containers/{id}/json': 1}
+
+
+class Bench(object):
+    """One fake daemon of a given size and the operations timed against it
+
+    Operations run in order and change the daemon as they go, e.g. run
+    adds containers and teardown removes everything."""
+
+    def __init__(self, containers, images, latency, workers, workdir):
+        self.containers = containers
+        self.images = images
+        self.workers = workers
+        self.state = fakedocker.State(containers, images, latency)
+        self.workdir = workdir
+        self.socket = os.path.join(workdir, "docker.sock")
+        self.server = fakedocker.serve(self.socket, self.state)
+        self.templates = os.path.join(workdir, "templates") + "/"
+        self.rundir = os.path.join(workdir, "run") + "/"
+        for d in (self.templates, self.rundir):
+            os.mkdir(d)
+        # Snapshots taken by run go to the user directory, keep them here
+        metadata.USER_TEMPLATE_DIR = self.templates
+        metadata.TEMPLATE_DIRS = [self.templates]
+        client.configure(base_url="unix://" + self.socket)
+        index.shared_images().invalidate()
+        index.shared_containers().invalidate()
+        self.c = client.get_client()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        client.configure()
+
+    def resolve(self):
+        """Looks up containers by name and by short ID, as create does"""
+        cids = self.state.containers.keys()[:RESOLVE_COUNT]
+        keys = [self.state.containers[cid]['Name'].lstrip('/') for cid in cids] + [cid[:8] for cid in cids]
+        containerindex = index.ContainerIndex(self.c)
+        for key in keys:
+            metadata.Create(cuid=key, force=False, outfile=None, directory=self.templates,
+                            containerindex=containerindex).checkcontaineruid()
+        return len(keys)
+
+    def create_one(self):
+        """Snapshots one container by name, as container-template create does
+
+        Fails when it makes any call beyond CREATE_CALLS."""
+        name = self.state.containers.values()[0]['Name'].lstrip('/')
+        index.shared_containers().invalidate()
+        calls = Counter(self.state.calls)
+        metadata.Create(cuid=name, force=True, outfile=None, directory=self.templates).write_files()
+        made = Counter(self.state.calls)
+        made.subtract(calls)
+        made = dict((call, n) for call, n in made.items() if n)
+        if made != CREATE_CALLS:
+            raise AssertionError("create made {0}, expected {1}".format(made, CREATE_CALLS))
+        return 1
+
+    def snapshot(self):
+        metadata.Batch(all=True, force=True, directory=self.templates, workers=self.workers).write_files()
+        return len(self.state.containers)
+
+    def drift(self):
+        metadata.Drift(directory=self.templates, workers=self.workers).check()
+        return len(self.state.containers)
+
+    def kube_list(self):
+        """Exports every container as one Kubernetes List, pods merged"""
+        metadata.KubeList(all=True, merge=True, output=os.path.join(self.workdir, "kube-list.json"),
+                          workers=self.workers).export()
+        return len(self.state.containers)
+
+    def dash_containers(self):
+        """What one draw of the docker-dash container screen asks for"""
+        templates = catalog.TemplateCatalog(metadata.TEMPLATE_DIRS)
+        containers = self.c.containers(all=True)
+        templates.refresh()
+        for container in containers:
+            templates.has_template(container)
+        return len(containers)
+
+    def dash_images(self):
+        """What one draw of the docker-dash image screen asks for"""
+        images = self.c.images(all=True)
+        containers = self.c.containers(all=True)
+        inspects, _ = bulk.inspect_containers(self.c, [c['Id'] for c in containers], self.workers)
+        imagegraph.ImageGraph(images, [cins for cins in inspects if cins is not None])
+        return len(images)
+
+    def runtemplates(self):
+        """Copies up to RUN_COUNT snapshots under new names, so they can be run"""
+        paths = []
+        for i, filename in enumerate(sorted(f for f in os.listdir(self.templates)
+                                            if catalog.filekind(f) == catalog.TEMPLATE)[:RUN_COUNT + 1]):
+            with open(os.path.join(self.templates, filename)) as f:
+                params = json.load(f)
+            params[0]['Name'] = "/bench{0}".format(i)
+            path = os.path.join(self.rundir, "bench{0}.json".format(i))
+            with open(path, "w") as f:
+                json.dump(params, f)
+            paths.append(path)
+        return paths
+
+    def run_one(self):
+        docker_wrapper.Run(jsonfile=self.runtemplates()[-1]).start_container()
+        return 1
+
+    def run(self):
+        paths = self.runtemplates()[:-1]
+        docker_wrapper.BatchRun(paths=paths, workers=self.workers).start_containers()
+        return len(paths)
+
+    def teardown(self):
+        """Removes every container and image, as docker-dash --delete does"""
+        images = self.c.images(all=True)
+        remover = teardown.Teardown(self.c, self.workers)
+        graph = imagegraph.ImageGraph(images)
+        remover.execute(remover.plan(self.c.containers(all=True), graph, graph.images.keys()))
+        return len(images) + len(remover.removed_images)
+
+    OPERATIONS = [('resolve', resolve),
+                  ('create-one', create_one),
+                  ('snapshot', snapshot),
+                  ('resnapshot', snapshot),
+                  ('drift', drift),
+                  ('kube-list', kube_list),
+                  ('dash-containers', dash_containers),
+                  ('dash-images', dash_images),
+                  ('run-one', run_one),
+                  ('run', run),
+                  ('teardown', teardown)]
+
+    def measure(self, name, func):
+        """Times func, returns its result entry"""
+        calls = Counter(self.state.calls)
+        stdout, stderr = sys.stdout, sys.stderr
+        # The operations report as they go, only the timings are wanted
+        sys.stdout = sys.stderr = open(os.devnull, "w")
+        start = time.time()
+        error = None
+        try:
+            items = func(self)
+        except Exception as e:
+            items = 0
+            error = str(e) or e.__class__.__name__
+        finally:
+            elapsed = time.time() - start
+            sys.stdout.close()
+            sys.stdout, sys.stderr = stdout, stderr
+        made = Counter(self.state.calls)
+        made.subtract(calls)
+        made = dict((call, n) for call, n in made.items() if n and not call.startswith('pull '))
+        return {'operation': name,
+                'containers': self.containers,
+                'images': self.images,
+                'items': items,
+                'seconds': round(elapsed, 4),
+                'per_second': round(items / elapsed, 1) if elapsed > 0 else None,
+                'api_calls': sum(made.values()),
+                'calls': made,
+                'error': error}
+
+
+def version():
+    """The git revision of the tree benchmarked, when there is one"""
+    try:
+        with open(os.devnull, "w") as devnull:
+            return subprocess.check_output(["git", "describe", "--always", "--dirty"], stderr=devnull,
+                                           cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def printresults(results, baseline=None):
+    before = {}
+    for entry in (baseline or {}).get('results', []):
+        before[(entry['operation'], entry['containers'])] = entry
+    print "{0:16} {1:>6} {2:>8} {3:>9} {4:>9} {5:>8}{6}".format(
+        "Operation", "Size", "Items", "Seconds", "Per sec", "Calls", "  Before" if baseline else "")
+    for entry in results:
+        line = "{0:16} {1:6} {2:8} {3:9.3f} {4:9.1f} {5:8}".format(
+            entry['operation'], entry['containers'], entry['items'], entry['seconds'],
+            entry['per_second'] or 0, entry['api_calls'])
+        old = before.get((entry['operation'], entry['containers']))
+        if old is not None:
+            line += "  {0:.3f}s {1} calls".format(old['seconds'], old['api_calls'])
+        if entry['error']:
+            line += "  FAILED: " + entry['error']
+        print line
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times docker_utils operations against a fake docker daemon')
+    parser.add_argument('-s', '--sizes',
+                        default=','.join(str(size) for size in SIZES),
+                        help='Comma separated container counts to run with. Defaults to {0}.'.format(
+                            ','.join(str(size) for size in SIZES)))
+    parser.add_argument('-i', '--images',
+                        type=int,
+                        help='Images on the fake daemon. Defaults to a tenth of the containers, at least 4.')
+    parser.add_argument('-l', '--latency',
+                        type=float,
+                        default=0.0,
+                        help='Seconds the fake daemon waits before answering each request')
+    parser.add_argument('-w', '--workers',
+                        type=int,
+                        default=bulk.WORKERS,
+                        help='Workers for the bulk operations. Defaults to {0}.'.format(bulk.WORKERS))
+    parser.add_argument('--only',
+                        help='Comma separated operations to time: {0}'.format(
+                            ', '.join(name for name, _ in Bench.OPERATIONS)))
+    parser.add_argument('-o', '--output',
+                        help='Write the results as JSON to this file')
+    parser.add_argument('-b', '--baseline',
+                        help='Results of an earlier run to show next to these')
+    args = parser.parse_args()
+
+    only = args.only.split(',') if args.only else None
+    results = []
+    for size in [int(size) for size in args.sizes.split(',')]:
+        workdir = tempfile.mkdtemp(prefix="docker-utils-bench-")
+        try:
+            bench = Bench(size, args.images or max(4, size / 10), args.latency, args.workers, workdir)
+            try:
+                for name, func in Bench.OPERATIONS:
+                    if only is None or name in only:
+                        results.append(bench.measure(name, func))
+            finally:
+                bench.close()
+        finally:
+            shutil.rmtree(workdir)
+
+    report = {'version': version(),
+              'python': platform.python_version(),
+              'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+              'latency': args.latency,
+              'workers': args.workers,
+              'results': results}
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    printresults(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if any(entry['error'] for entry in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# A fake docker daemon serving synthetic containers and images on a unix
+# socket, enough of the remote API for docker_utils to run against
+
+import BaseHTTPServer
+import hashlib
+import json
+import os
+import Queue
+import re
+import SocketServer
+import struct
+import threading
+import time
+import urlparse
+from collections import Counter, OrderedDict
+
+# Images are built in chains this long, each layer the parent of the next
+CHAIN = 4
+LOG_LINES = 20
+
+
+def fakeid(seed):
+    return hashlib.sha256(seed).hexdigest()
+
+
+class State(object):
+    """Containers, images and API call counts of one fake daemon
+
+    latency is slept at the start of every request. Pulls send their
+    progress events pull_delay seconds apart, references starting with
+    'bad' fail. Container logs hold log_lines lines of log_width bytes."""
+
+    def __init__(self, containers=10, images=5, latency=0.0, pull_delay=0.0, log_lines=LOG_LINES, log_width=10):
+        self.lock = threading.Lock()
+        self.latency = latency
+        self.pull_delay = pull_delay
+        self.log_lines = log_lines
+        self.log_width = log_width
+        self.calls = Counter()
+        self.images = OrderedDict()
+        self.containers = OrderedDict()
+        self.names = {}
+        self.subscribers = []
+        parent = ''
+        for i in range(images):
+            iid = fakeid('image%d' % i)
+            if i % CHAIN == 0:
+                parent = ''
+            # The top layer of each chain is tagged, the layers below are not
+            tags = ['repo%d:latest' % i] if i % CHAIN == CHAIN - 1 or i == images - 1 else ['<none>:<none>']
+            self.images[iid] = {'Id': iid, 'ParentId': parent, 'RepoTags': tags, 'Created': 1400000000 + i,
+                                'VirtualSize': 1000000 * (i + 1), 'Size': 1000000}
+            parent = iid
+        tagged = [tid for tid, image in self.images.items() if image['RepoTags'] != ['<none>:<none>']]
+        for i in range(containers):
+            cid = fakeid('container%d' % i)
+            self.add(cid, 'cont%d' % i, tagged[i % len(tagged)] if tagged else 'scratch', i % 2 == 0)
+
+    def add(self, cid, name, image, running):
+        ref = self.images[image]['RepoTags'][0] if image in self.images else image
+        self.containers[cid] = {
+            'Id': cid, 'Name': '/' + name, 'Image': image, 'Created': '2014-10-01T00:00:00Z',
+            'HostsPath': '/var/lib/docker/containers/{0}/hosts'.format(cid),
+            'ResolvConfPath': '/var/lib/docker/containers/{0}/resolv.conf'.format(cid),
+            'HostnamePath': '/var/lib/docker/containers/{0}/hostname'.format(cid),
+            'State': {'Running': running, 'Pid': 100 if running else 0, 'ExitCode': 0,
+                      'StartedAt': '2014-10-01T00:00:01Z', 'FinishedAt': '0001-01-01T00:00:00Z'},
+            'Config': {'Hostname': cid[:12], 'Domainname': '', 'User': '', 'Image': ref,
+                       'Cmd': ['/bin/sh', '-c', 'sleep 1'], 'Entrypoint': None, 'Env': ['A=1', 'B=2'],
+                       'WorkingDir': '', 'Memory': 0, 'MemorySwap': 0, 'CpuShares': 0, 'Cpuset': '',
+                       'NetworkDisabled': False, 'AttachStdin': False, 'AttachStdout': True,
+                       'AttachStderr': True, 'OpenStdin': False, 'Tty': False, 'ExposedPorts': {'80/tcp': {}}},
+            'HostConfig': {'Binds': None, 'Links': None, 'LxcConf': [], 'Privileged': False,
+                           'PortBindings': {'80/tcp': [{'HostIp': '', 'HostPort': '8080'}]},
+                           'PublishAllPorts': False, 'Dns': None, 'DnsSearch': None, 'VolumesFrom': None,
+                           'NetworkMode': 'bridge', 'RestartPolicy': {}, 'CapAdd': None, 'CapDrop': None},
+            'NetworkSettings': {'IPAddress': '172.17.0.2',
+                                'Ports': {'80/tcp': [{'HostIp': '0.0.0.0', 'HostPort': '8080'}]}},
+            'Volumes': {'/data': '/var/lib/docker/vfs/dir/' + cid},
+            'VolumesRW': {'/data': True}}
+        self.names[name] = cid
+        return self.containers[cid]
+
+    def find_container(self, key):
+        cid = key if key in self.containers else self.names.get(key.lstrip('/'))
+        if cid is None and re.match('^[0-9a-f]{3,}$', key):
+            cid = next((cid for cid in self.containers if cid.startswith(key)), None)
+        return self.containers.get(cid)
+
+    def find_image(self, key):
+        if key in self.images:
+            return key
+        if ':' not in key:
+            key += ':latest'
+        return next((iid for iid, image in self.images.items()
+                     if iid.startswith(key) or key in image['RepoTags']), None)
+
+    def listentry(self, container):
+        running = container['State']['Running']
+        return {'Id': container['Id'], 'Names': [container['Name']], 'Image': container['Config']['Image'],
+                'Command': ' '.join(container['Config']['Cmd']), 'Created': 1412121600, 'Ports': [],
+                'Status': 'Up 2 minutes' if running else 'Exited (0) 1 minutes ago'}
+
+    def emit(self, status, eid, image=None):
+        event = {'status': status, 'id': eid, 'time': int(time.time())}
+        if image is not None:
+            event['from'] = image
+        for queue in list(self.subscribers):
+            queue.put(event)
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def address_string(self):
+        return 'unix'
+
+    def reply(self, code, body=None, ctype='application/json'):
+        data = '' if body is None else (body if isinstance(body, str) else json.dumps(body))
+        self.send_response(code)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def chunked(self, ctype):
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def chunk(self, data):
+        self.wfile.write('%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        self.route('GET')
+
+    def do_POST(self):
+        self.route('POST')
+
+    def do_DELETE(self):
+        self.route('DELETE')
+
+    def route(self, method):
+        state = self.server.state
+        url = urlparse.urlparse(self.path)
+        path = re.sub(r'^/v[0-9.]+', '', url.path)
+        query = dict((k, v[0]) for k, v in urlparse.parse_qs(url.query).items())
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        # Count calls per endpoint, with IDs and names left out
+        endpoint = re.sub(r'^/(containers|images)/(?!json$|create$)[^/]+', r'/\1/{id}', path)
+        with state.lock:
+            state.calls['{0} {1}'.format(method, endpoint)] += 1
+        if state.latency:
+            time.sleep(state.latency)
+        m = re.match(r'^/containers/([^/]+)(/\w+)?$', path)
+        if path == '/events' and method == 'GET':
+            return self.events(state)
+        if path == '/images/create' and method == 'POST':
+            return self.pull(state, query)
+        if m and m.group(2) == '/logs' and method == 'GET':
+            return self.logs(state, m.group(1), query)
+        with state.lock:
+            if path == '/containers/json' and method == 'GET':
+                everything = query.get('all') in ('1', 'True', 'true')
+                return self.reply(200, [state.listentry(c) for c in state.containers.values()
+                                        if everything or c['State']['Running']])
+            if path == '/images/json' and method == 'GET':
+                everything = query.get('all') in ('1', 'True', 'true')
+                return self.reply(200, [image for image in state.images.values()
+                                        if everything or image['RepoTags'] != ['<none>:<none>']])
+            if path == '/containers/create' and method == 'POST':
+                return self.create(state, json.loads(body), query)
+            if m:
+                return self.container(state, method, m.group(1), m.group(2))
+            m = re.match(r'^/images/(.+)$', path)
+            if m and method == 'DELETE':
+                return self.removeimage(state, m.group(1))
+        return self.reply(404, 'page not found', 'text/plain')
+
+    def create(self, state, config, query):
+        cid = fakeid('created{0}{1}'.format(len(state.containers), time.time()))
+        name = query.get('name', cid[:12]).lstrip('/')
+        if name in state.names:
+            return self.reply(409, 'Conflict, the name {0} is already in use'.format(name), 'text/plain')
+        image = state.find_image(config.get('Image') or '')
+        if image is None:
+            return self.reply(404, 'No such image: {0}'.format(config.get('Image')), 'text/plain')
+        state.add(cid, name, image, False)
+        state.emit('create', cid, config['Image'])
+        return self.reply(201, {'Id': cid, 'Warnings': None})
+
+    def container(self, state, method, key, action):
+        container = state.find_container(key)
+        if container is None:
+            return self.reply(404, 'No such container: {0}'.format(key), 'text/plain')
+        cid = container['Id']
+        if method == 'GET' and action == '/json':
+            return self.reply(200, container)
+        if method == 'POST' and action == '/start':
+            container['State']['Running'] = True
+            state.emit('start', cid, container['Config']['Image'])
+            return self.reply(204)
+        if method == 'POST' and action in ('/stop', '/kill'):
+            container['State']['Running'] = False
+            state.emit('die', cid, container['Config']['Image'])
+            return self.reply(204)
+        if method == 'DELETE' and action is None:
+            if container['State']['Running']:
+                return self.reply(409, 'Conflict, you cannot remove a running container', 'text/plain')
+            del state.containers[cid]
+            state.names.pop(container['Name'].lstrip('/'), None)
+            state.emit('destroy', cid, container['Config']['Image'])
+            return self.reply(204)
+        return self.reply(404, 'page not found', 'text/plain')
+
+    def removeimage(self, state, key):
+        iid = state.find_image(key)
+        if iid is None:
+            return self.reply(404, 'No such image: {0}'.format(key), 'text/plain')
+        if any(image['ParentId'] == iid for image in state.images.values()):
+            return self.reply(409, 'Conflict, {0} has dependent child images'.format(iid[:12]), 'text/plain')
+        if any(c['Image'] == iid for c in state.containers.values()):
+            return self.reply(409, 'Conflict, {0} is used by a container'.format(iid[:12]), 'text/plain')
+        del state.images[iid]
+        state.emit('delete', iid)
+        return self.reply(200, [{'Deleted': iid}])
+
+    def pull(self, state, query):
+        ref = "{0}:{1}".format(query.get('fromImage', ''), query.get('tag') or 'latest')
+        with state.lock:
+            state.calls['pull ' + ref] += 1
+        events = [{'status': 'Pulling repository ' + ref}]
+        if ref.startswith('bad'):
+            events.append({'errorDetail': {'message': 'not found'}, 'error': 'Error: image {0} not found'.format(ref)})
+        else:
+            for layer in ('layer1', 'layer2'):
+                events.append({'status': 'Pulling fs layer', 'id': layer, 'progressDetail': {}})
+                events.extend({'status': 'Downloading', 'id': layer,
+                               'progressDetail': {'current': mb * 1048576, 'total': 4 * 1048576}}
+                              for mb in range(1, 5))
+                events.append({'status': 'Download complete', 'id': layer, 'progressDetail': {}})
+            events.append({'status': 'Status: Downloaded newer image for ' + ref})
+        self.chunked('application/json')
+        for event in events:
+            self.chunk(json.dumps(event) + '\r\n')
+            if state.pull_delay:
+                time.sleep(state.pull_delay)
+        if not ref.startswith('bad'):
+            iid = fakeid(ref)
+            with state.lock:
+                state.images[iid] = {'Id': iid, 'ParentId': '', 'RepoTags': [ref], 'Created': int(time.time()),
+                                     'VirtualSize': 8388608, 'Size': 8388608}
+            state.emit('pull', ref)
+        self.wfile.write('0\r\n\r\n')
+
+    def logs(self, state, key, query):
+        with state.lock:
+            container = state.find_container(key)
+        if container is None:
+            return self.reply(404, 'No such container: {0}'.format(key), 'text/plain')
+        tail = query.get('tail', 'all')
+        start = 0 if tail == 'all' else max(0, state.log_lines - int(tail))
+        self.chunked('application/vnd.docker.raw-stream')
+
+        def frame(i, text):
+            # Every fifth line goes to stderr
+            self.chunk(struct.pack('>BxxxL', 2 if i % 5 == 4 else 1, len(text)) + text)
+        try:
+            for i in range(start, state.log_lines):
+                frame(i, '{0} line {1} {2}\n'.format(container['Name'], i, 'x' * state.log_width))
+            i = state.log_lines
+            while query.get('follow') == '1':
+                time.sleep(0.2)
+                frame(i, '{0} live {1}\n'.format(container['Name'], i))
+                i += 1
+            self.wfile.write('0\r\n\r\n')
+        except IOError:
+            pass
+
+    def events(self, state):
+        queue = Queue.Queue()
+        state.subscribers.append(queue)
+        self.chunked('application/json')
+        try:
+            while True:
+                self.chunk(json.dumps(queue.get()))
+        except IOError:
+            state.subscribers.remove(queue)
+
+
+class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def serve(path, state):
+    """Serves state on the unix socket path from a background thread"""
+    if os.path.exists(path):
+        os.unlink(path)
+    server = Server(path, Handler)
+    server.state = state
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
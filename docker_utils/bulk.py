@@ -0,0 +1,181 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Bounded fan-out of docker API calls
+
+import Queue
+import threading
+import time
+
+WORKERS = 8
+# Seconds between checks while waiting for workers, a wait without a
+# timeout cannot be interrupted by Ctrl-C
+WAIT_TIMEOUT = 1
+
+
+def _call(func):
+    def wrapped(item):
+        try:
+            return func(item), None
+        except Exception as e:
+            return None, e
+    return wrapped
+
+
+class WorkerPool(object):
+    """Daemon threads shared by every run() in the process
+
+    A thread is started only when none is idle, and is kept for the life
+    of the process, so the number of threads is the most calls ever in
+    flight at once, and a run() pays neither thread start-up nor pool
+    shutdown."""
+
+    def __init__(self):
+        self.tasks = Queue.Queue()
+        self.lock = threading.Lock()
+        self.idle = 0
+        self.threads = 0
+
+    def submit(self, task):
+        """Runs task() on an idle thread, or a new one. task must not raise"""
+        with self.lock:
+            if self.idle:
+                self.idle -= 1
+            else:
+                self.threads += 1
+                worker = threading.Thread(target=self.work, name="bulk-{0}".format(self.threads))
+                worker.daemon = True
+                worker.start()
+        self.tasks.put(task)
+
+    def work(self):
+        while True:
+            task = self.tasks.get()
+            try:
+                task()
+            except BaseException:
+                # map() hands it to the caller, the thread stays in the pool
+                pass
+            with self.lock:
+                self.idle += 1
+
+    def map(self, call, items, width):
+        """Returns [call(item)] for items, with at most width calls at once
+
+        width - 1 threads and the calling one each take the next item until
+        none is left, so thousands of items still use width threads, and a
+        run() nested in a call always makes progress. What call does not
+        catch, e.g. KeyboardInterrupt or SystemExit, stops the other
+        threads taking items and is raised here."""
+        outcomes = [None] * len(items)
+        pending = enumerate(items)
+        lock = threading.Lock()
+        done = threading.Event()
+        running = [width]
+        raised = []
+
+        def drain():
+            try:
+                while True:
+                    with lock:
+                        nextitem = None if raised else next(pending, None)
+                    if nextitem is None:
+                        break
+                    outcomes[nextitem[0]] = call(nextitem[1])
+            except BaseException as e:
+                with lock:
+                    raised.append(e)
+                raise
+            finally:
+                with lock:
+                    running[0] -= 1
+                    if not running[0]:
+                        done.set()
+        for _ in range(width - 1):
+            self.submit(drain)
+        drain()
+        try:
+            while not done.is_set():
+                done.wait(WAIT_TIMEOUT)
+        except BaseException as e:
+            # Ctrl-C while waiting, the other threads take no more items
+            with lock:
+                raised.append(e)
+            raise
+        if raised:
+            raise raised[0]
+        return outcomes
+
+
+_pool = WorkerPool()
+
+
+def run(func, items, workers=WORKERS, key=None):
+    """Calls func(item) for every item on at most workers threads
+
+    Returns (results, errors). results keeps the order of items and holds
+    None where the call failed, errors maps key(item), or the item itself,
+    to the exception of each failed call."""
+    items = list(items)
+    if not items:
+        return [], {}
+    if workers <= 1 or len(items) == 1:
+        outcomes = [_call(func)(item) for item in items]
+    else:
+        outcomes = _pool.map(_call(func), items, min(workers, len(items)))
+    results = []
+    errors = {}
+    for item, (result, error) in zip(items, outcomes):
+        results.append(result)
+        if error is not None:
+            errors[item if key is None else key(item)] = error
+    return results, errors
+
+
+def inspect_containers(c, cids, workers=WORKERS):
+    """Inspects every container in cids concurrently, see run()"""
+    return run(c.inspect_container, cids, workers)
+
+
+class Stages(object):
+    """Runs named stages through run() and records how long each took"""
+
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self.stats = []
+
+    def run(self, name, func, items, label=None, key=None):
+        """Like run(), also prints each failure and records the timing"""
+        items = list(items)
+        start = time.time()
+        results, errors = run(func, items, self.workers, key)
+        elapsed = time.time() - start
+        for item, err in errors.items():
+            print "Unable to {0} {1}: {2}".format(name, item, err)
+        self.record(label or name, len(items) - len(errors), len(errors), elapsed)
+        return results, errors
+
+    def record(self, label, done, failed, elapsed):
+        """Records a stage that was run some other way"""
+        self.stats.append((label, done, failed, elapsed))
+
+    def printsummary(self):
+        print ""
+        print "{0:16} {1:>6} {2:>6} {3:>8} {4:>8}".format("Stage", "Done", "Failed", "Seconds", "Per sec")
+        for name, done, failed, elapsed in self.stats:
+            rate = done / elapsed if elapsed > 0 else 0
+            print "{0:16} {1:6} {2:6} {3:8.2f} {4:8.1f}".format(name, done, failed, elapsed, rate)
@@ -0,0 +1,235 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Index of the template files in the template directories
+
+import fnmatch
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from docker_utils import fileutil, index
+from docker_utils.templates import TEMPLATE, filekind
+
+# Per directory cache of what was read from each file
+CACHE_NAME = ".catalog.json"
+CACHE_VERSION = 1
+
+
+class Entry(object):
+    """One file of a template directory
+
+    For templates, image and name come from the inspect inside. cid is
+    the container ID when the file is named after one, as snapshots of
+    containers with generated names are."""
+
+    def __init__(self, path, mtime, size, kind, image=None, name=None):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.kind = kind
+        self.image = image
+        self.name = name
+        stem = os.path.basename(path)[:-len('.json')] if kind == TEMPLATE else None
+        self.cid = stem if stem and re.match('^[0-9a-f]{12,64}$', stem) else None
+
+    def cached(self):
+        return [self.mtime, self.size, self.kind, self.image, self.name]
+
+
+def readtemplate(path):
+    """Returns (image, name) of a template file, (None, None) if unreadable"""
+    try:
+        with open(path) as f:
+            params = json.load(f)
+        inspect = params[0]
+        return inspect['Config'].get('Image') or None, (inspect.get('Name') or '').lstrip('/') or None
+    except (IOError, ValueError, KeyError, IndexError, TypeError, AttributeError):
+        return None, None
+
+
+class TemplateCatalog(object):
+    """Template files of several directories with their image and name
+
+    refresh() stats every file and only reads the ones whose mtime or
+    size changed, and keeps what it read in a cache file in each
+    directory, so other processes can skip reading them. Lookups scan
+    once, then again only after ttl seconds, when a ttl is given."""
+
+    def __init__(self, dirs, ttl=None, cache=True):
+        self.dirs = dirs
+        self.ttl = ttl
+        self.cache = cache
+        self.entries = OrderedDict()
+        self.scanned = None
+        self._loaded = set()
+        self._byid = {}
+        self._byname = {}
+        self._byimage = {}
+
+    def stale(self):
+        return self.scanned is None or \
+            (self.ttl is not None and time.time() - self.scanned >= self.ttl)
+
+    def _check(self):
+        if self.stale():
+            self.refresh()
+
+    def refresh(self):
+        changed = False
+        entries = OrderedDict()
+        for d in self.dirs:
+            changed = self.scandir(d, entries) or changed
+        self.entries = entries
+        if changed or self.scanned is None:
+            self.reindex()
+        self.scanned = time.time()
+
+    def scandir(self, directory, entries):
+        """Adds the entries of directory, returns True if any file changed"""
+        if not os.path.isdir(directory):
+            return False
+        previous = self.entries
+        if self.cache and directory not in self._loaded:
+            previous = dict(previous)
+            previous.update(self.loadcache(directory))
+            self._loaded.add(directory)
+        changed = False
+        seen = set()
+        for filename in sorted(os.listdir(directory)):
+            kind = filekind(filename)
+            if kind is None:
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            seen.add(path)
+            old = previous.get(path)
+            if old is not None and old.mtime == st.st_mtime and old.size == st.st_size:
+                entries[path] = old
+                continue
+            image, name = readtemplate(path) if kind == TEMPLATE else (None, None)
+            entries[path] = Entry(path, st.st_mtime, st.st_size, kind, image, name)
+            changed = True
+        removed = [gone for gone in previous if os.path.dirname(gone) == directory.rstrip('/') and gone not in seen]
+        if changed or removed:
+            self.savecache(directory, entries)
+        return changed or bool(removed)
+
+    def loadcache(self, directory):
+        try:
+            with open(os.path.join(directory, CACHE_NAME)) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+            return {}
+        found = {}
+        for filename, cached in (data.get('files') or {}).items():
+            path = os.path.join(directory, str(filename))
+            try:
+                found[path] = Entry(path, *cached)
+            except TypeError:
+                continue
+        return found
+
+    def savecache(self, directory, entries):
+        if not self.cache:
+            return
+        files = dict((os.path.basename(path), entry.cached()) for path, entry in entries.items()
+                     if os.path.dirname(path) == directory.rstrip('/'))
+        try:
+            fileutil.atomic_write(os.path.join(directory, CACHE_NAME),
+                                  json.dumps({'version': CACHE_VERSION, 'files': files}))
+        except (IOError, OSError):
+            # A directory we may not write to, e.g. the system templates
+            pass
+
+    def reindex(self):
+        self._byid = {}
+        self._byname = {}
+        self._byimage = {}
+        for entry in self.entries.values():
+            if entry.kind != TEMPLATE:
+                continue
+            if entry.cid:
+                self._byid.setdefault(entry.cid, entry)
+                self._byid.setdefault(entry.cid[:index.SHORT_ID_LEN], entry)
+            if entry.name:
+                self._byname.setdefault(entry.name, entry)
+            if entry.image:
+                self._byimage.setdefault("{0}:{1}".format(*index.split_tag(entry.image)), []).append(entry)
+
+    def files(self):
+        self._check()
+        return [entry.path for entry in self.entries.values()]
+
+    def templates(self, directory=None):
+        """Template entries, optionally only those in directory"""
+        self._check()
+        found = [entry for entry in self.entries.values() if entry.kind == TEMPLATE]
+        if directory is not None:
+            found = [entry for entry in found if os.path.dirname(entry.path) == directory.rstrip('/')]
+        return found
+
+    def for_container(self, container):
+        """Returns the template saved from a container list entry, or None"""
+        self._check()
+        entry = self._byid.get(container['Id']) or self._byid.get(container['Id'][:index.SHORT_ID_LEN])
+        if entry is not None:
+            return entry
+        for name in container.get('Names') or [container.get('Name') or '']:
+            entry = self._byname.get(name.lstrip('/'))
+            if entry is not None:
+                return entry
+        return None
+
+    def has_template(self, container):
+        return self.for_container(container) is not None
+
+    def search(self, image=None, name=None):
+        """Returns the templates matching image and name
+
+        Either may be a glob; without wildcards image is an exact
+        reference, 'fedora' meaning 'fedora:latest' as for docker run."""
+        self._check()
+        if image and not re.search(r'[*?\[]', image):
+            found = list(self._byimage.get("{0}:{1}".format(*index.split_tag(image)), []))
+        else:
+            found = self.templates()
+            if image:
+                found = [entry for entry in found if entry.image and fnmatch.fnmatchcase(entry.image, image)]
+        if name:
+            name = name.lstrip('/')
+            found = [entry for entry in found if entry.name and fnmatch.fnmatchcase(entry.name, name)]
+        return found
+
+
+_shared = {}
+
+
+def shared(dirs):
+    """Returns the process-wide catalog of dirs
+
+    It scans once; call refresh() for a rescan of changed files."""
+    key = tuple(dirs)
+    if key not in _shared:
+        _shared[key] = TemplateCatalog(list(dirs))
+    return _shared[key]
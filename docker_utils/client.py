@@ -0,0 +1,114 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Process-wide docker API client
+
+import os
+import threading
+import docker
+from docker_utils import trace
+
+BASE_URL = 'unix://var/run/docker.sock'
+API_VERSION = '1.12'
+TIMEOUT = 10
+POOL_SIZE = 10
+
+_settings = {'base_url': os.environ.get('DOCKER_HOST', BASE_URL),
+             'version': API_VERSION,
+             'timeout': TIMEOUT,
+             'pool_size': POOL_SIZE}
+_client = None
+_lock = threading.Lock()
+
+
+def configure(base_url=None, version=None, timeout=None, pool_size=None):
+    """Override connection settings. Drops the current shared client"""
+    global _client
+    with _lock:
+        if base_url is not None:
+            _settings['base_url'] = base_url
+        if version is not None:
+            _settings['version'] = version
+        if timeout is not None:
+            _settings['timeout'] = timeout
+        if pool_size is not None:
+            _settings['pool_size'] = pool_size
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
+def base_url():
+    return _settings['base_url']
+
+
+def new_client(**overrides):
+    """Returns a new client using the configured settings
+
+    Keyword arguments override single settings, e.g. timeout=None for a
+    client that blocks on a long lived stream"""
+    settings = dict(_settings, **overrides)
+    c = docker.Client(base_url=settings['base_url'],
+                      version=settings['version'],
+                      timeout=settings['timeout'])
+    if 'http+docker://' in c.adapters:
+        # Keep up to pool_size idle sockets instead of one so concurrent
+        # callers reuse connections rather than reconnecting
+        c.mount('http+docker://', PooledUnixAdapter(c.adapters['http+docker://'],
+                                                    settings['pool_size']))
+    return trace.instrument(c)
+
+
+def get_client():
+    """Returns the shared client, creating it on first use"""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = new_client()
+        return _client
+
+
+class PooledUnixAdapter(docker.unixconn.UnixAdapter):
+    """Sends every request through one pool of up to pool_size connections
+
+    docker-py keys its pools by request URL, so every container got a
+    pool and a socket of its own, and past ten pools the oldest was
+    closed while other threads were still using it."""
+
+    def __init__(self, adapter, pool_size):
+        super(PooledUnixAdapter, self).__init__(
+            'http+unix://' + adapter.socket_path, adapter.timeout)
+        self.pool_size = pool_size
+        self.pool = None
+
+    def get_connection(self, url, proxies=None):
+        with self.pools.lock:
+            if self.pool is None:
+                pool = docker.unixconn.unixconn.UnixHTTPConnectionPool(url, self.socket_path, self.timeout)
+                idle = pool.QueueCls(self.pool_size)
+                for _ in range(self.pool_size):
+                    idle.put(None)
+                pool.pool = idle
+                self.pool = pool
+            return self.pool
+
+    def close(self):
+        with self.pools.lock:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool = None
+        super(PooledUnixAdapter, self).close()
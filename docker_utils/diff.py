@@ -0,0 +1,158 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Structural diff of JSON documents, e.g. two templates
+
+import copy
+import difflib
+import hashlib
+import json
+
+_encoder = json.JSONEncoder(sort_keys=True, separators=(',', ':'))
+
+
+def canonical(obj):
+    """Encodes obj the same way whatever the order of its keys"""
+    return _encoder.encode(obj)
+
+
+def digest(obj):
+    return hashlib.sha1(canonical(obj)).hexdigest()
+
+
+def pointer(path, key):
+    """Appends key to a JSON pointer"""
+    return "{0}/{1}".format(path, unicode(key).replace('~', '~0').replace('/', '~1'))
+
+
+def diff(a, b, path=""):
+    """Returns the differences from a to b as JSON patch style operations
+
+    Each operation is a dict with op (add, remove or replace), path (a
+    JSON pointer) and value; remove and replace also carry old. Lists
+    are compared in order: elements are matched up the way difflib
+    matches lines, so an insertion shows as one add. List indexes in
+    remove and replace paths refer to a, in add paths to b."""
+    ops = []
+    _diff(a, b, path, ops)
+    return ops
+
+
+def _diff(a, b, path, ops):
+    if a == b:
+        return
+    if isinstance(a, dict) and isinstance(b, dict):
+        for key in sorted(a):
+            if key not in b:
+                ops.append({'op': 'remove', 'path': pointer(path, key), 'old': a[key]})
+            else:
+                _diff(a[key], b[key], pointer(path, key), ops)
+        for key in sorted(b):
+            if key not in a:
+                ops.append({'op': 'add', 'path': pointer(path, key), 'value': b[key]})
+    elif isinstance(a, list) and isinstance(b, list):
+        _difflist(a, b, path, ops)
+    else:
+        ops.append({'op': 'replace', 'path': path, 'old': a, 'value': b})
+
+
+def _difflist(a, b, path, ops):
+    matcher = difflib.SequenceMatcher(None, [canonical(x) for x in a], [canonical(x) for x in b],
+                                      autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        # Changed elements pair up by position, the surplus is removed or added
+        paired = min(i2 - i1, j2 - j1)
+        for k in range(paired):
+            _diff(a[i1 + k], b[j1 + k], pointer(path, i1 + k), ops)
+        for i in range(i1 + paired, i2):
+            ops.append({'op': 'remove', 'path': pointer(path, i), 'old': a[i]})
+        for j in range(j1 + paired, j2):
+            ops.append({'op': 'add', 'path': pointer(path, j), 'value': b[j]})
+
+
+def prune(doc, ignore):
+    """Returns a copy of doc without the paths in ignore
+
+    Paths are JSON pointers, a * segment matches any key or index, e.g.
+    /0/State or /*/Config/Hostname."""
+    if not ignore:
+        return doc
+    doc = copy.deepcopy(doc)
+    for path in ignore:
+        parts = [p.replace('~1', '/').replace('~0', '~') for p in path.strip('/').split('/')]
+        _prune(doc, parts)
+    return doc
+
+
+def _prune(node, parts):
+    if isinstance(node, dict):
+        keys = node.keys() if parts[0] == '*' else [parts[0]]
+    elif isinstance(node, list):
+        if parts[0] == '*':
+            keys = range(len(node))
+        elif parts[0].isdigit() and int(parts[0]) < len(node):
+            keys = [int(parts[0])]
+        else:
+            return
+    else:
+        return
+    for key in reversed(keys) if isinstance(node, list) else keys:
+        if isinstance(node, dict) and key not in node:
+            continue
+        if len(parts) == 1:
+            del node[key]
+        else:
+            _prune(node[key], parts[1:])
+
+
+class Baseline(object):
+    """One document diffed against many
+
+    The baseline is pruned and encoded once. Documents are compared by
+    their canonical digest first: an identical document costs one
+    encoding, and documents identical to one already seen reuse its
+    result."""
+
+    def __init__(self, doc, ignore=()):
+        self.ignore = ignore
+        self.doc = prune(doc, ignore)
+        self.digest = digest(self.doc)
+        self._results = {self.digest: []}
+
+    def compare(self, doc):
+        """Returns the operations turning the baseline into doc"""
+        doc = prune(doc, self.ignore)
+        key = digest(doc)
+        if key not in self._results:
+            self._results[key] = diff(self.doc, doc)
+        return self._results[key]
+
+    def compare_many(self, docs):
+        """Compares every (name, doc) pair, returns [(name, operations)]"""
+        return [(name, self.compare(doc)) for name, doc in docs]
+
+
+def describe(op):
+    """One line description of an operation"""
+    path = op['path'] or "(document)"
+    if op['op'] == 'add':
+        return "{0} added: {1}".format(path, json.dumps(op['value']))
+    if op['op'] == 'remove':
+        return "{0} removed: {1}".format(path, json.dumps(op['old']))
+    return "{0}: {1} -> {2}".format(path, json.dumps(op['old']), json.dumps(op['value']))
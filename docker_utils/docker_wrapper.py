@@ -20,15 +20,41 @@
 
 import json
 import os
+import pipes
 import subprocess
-import docker
-from docker_utils import metadata
+import time
+from collections import OrderedDict
+from docker_utils import bulk, client, metadata, index, pull, translate
+from docker_utils.templates import expand_templates, load_template
+
+
+def validate_templates(paths):
+    """Translates every template under paths, returns the number that failed"""
+    errors = OrderedDict()
+    start = time.time()
+    templates = expand_templates(paths, errors)
+    loaded = time.time()
+    for path, params in templates.items():
+        try:
+            translate.translate(params)
+        except metadata.TemplateError as e:
+            errors[path] = e
+    elapsed = time.time() - loaded
+    for path, err in errors.items():
+        print "{0}: {1}".format(path, err)
+    total = len(templates) + len([path for path in errors if path not in templates])
+    print "{0} template(s), {1} invalid. Read in {2:.2f}s, translated in {3:.3f}s ({4:.0f} per second)".format(
+        total, len(errors), loaded - start, elapsed, len(templates) / elapsed if elapsed > 0 else 0)
+    return len(errors)
 
 
 class Run(object):
     def __init__(self, **kwargs):
-        # self.dockercommand = kwargs['command']
-        self.jsonfile = kwargs['jsonfile']
+        self.dockercommand = kwargs.get('command') or "run"
+        self.jsonfile = kwargs.get('jsonfile')
+        # docker CLI binary and -H value for the cli backend
+        self.docker = kwargs.get('docker') or "docker"
+        self.host = kwargs.get('host')
         # FIXME
         self.remove = True
 
@@ -60,13 +86,7 @@ class Run(object):
 
     def formfinaldict(self, mydict):
         newdict = {}
-        keymap = {'CpuShares': 'cpu-shares', 'Cpuset': 'cpuset', 'Env': 'env', 'Hostname': 'hostname',
-                  'Image': 'image', 'Memory': 'memory', 'Tty': 'tty', 'User': 'user', 'WorkingDir': 'workdir',
-                  'CapAdd': 'cap-add', 'CapDrop': 'cap-drop', 'ContainerIDFile': 'cidfile', 'Dns': 'dns',
-                  'DnsSearch': 'dns-search', 'Links': 'link', 'LxcConf': 'lxc-conf', 'NetworkMode': 'net',
-                  'PortBindings': 'publish', 'Privileged': 'privileged', 'PublishAllPorts': 'publish=all',
-                  'Binds': 'volume'
-                  }
+        keymap = translate.cli_keymap()
         # Assemble attach
         attach = []
         if 'AttachStdin' in mydict:
@@ -82,16 +102,17 @@ class Run(object):
         if len(attach) > 0:
             newdict['attach'] = attach
 
-        if mydict['Hostname'] == "localhost":
+        if mydict.get('Hostname') == "localhost":
             del mydict['Hostname']
 
         # Deal with port bindings
         if 'PortBindings' in mydict:
             # hostip = mydict['PortBindings]'
-            print ""
             pbind = []
             for k, v in mydict['PortBindings'].iteritems():
-                containerport = self.mystringreplace(self.mystringreplace(k, "/tcp"), "/udp")
+                if not v:
+                    continue
+                containerport = self.mystringreplace(k, "/tcp")
                 if v[0]['HostIp'] == "":
                     # pbind.append(("{0}::{1}".format(mydict['PortBindings'][k][0]['HostPort'])))
                     hostport = mydict['PortBindings'][k][0]['HostPort']
@@ -104,8 +125,22 @@ class Run(object):
             del mydict['PortBindings']
 
         # Grab the docker CMD
-        newdict['dockercommand'] = mydict['Cmd'][0]
-        del mydict['Cmd']
+        newdict['dockercommand'] = list(mydict.pop('Cmd', None) or [])
+
+        # --link takes name:alias, inspect gives /name:/container/alias
+        if 'Links' in mydict:
+            mydict['Links'] = ["{0}:{1}".format(name.lstrip('/'), alias.rsplit('/', 1)[-1])
+                               for name, alias in (link.split(':', 1) for link in mydict['Links'])]
+        if 'LxcConf' in mydict:
+            mydict['LxcConf'] = ["{0}={1}".format(conf['Key'], conf['Value']) for conf in mydict['LxcConf']]
+
+        # --entrypoint takes one word, the rest goes before the command
+        entrypoint = mydict.pop('Entrypoint', None)
+        if entrypoint:
+            if not isinstance(entrypoint, list):
+                entrypoint = [entrypoint]
+            newdict['entrypoint'] = entrypoint[0]
+            newdict['dockercommand'] = entrypoint[1:] + newdict['dockercommand']
 
         # Push left over values to newdict
         for keys in mydict.keys():
@@ -115,226 +150,336 @@ class Run(object):
         return newdict
 
     def stripParams(self, params):
+        """Flattens the sections of a template into one dict of set values"""
         newdict = {}
         containername = ""
-        for num in range(len(params)):
-            for l2 in params[num].iterkeys():
-                if l2 == "Name":
-                    containername = params[num][l2]
-                    # params.pop(num)
-                    break
-                for k, v in params[num][l2].iteritems():
-                    if v not in [0, "None", None, "", []]:
-                        newdict[k] = v
+        for entry in params:
+            for section, values in entry.iteritems():
+                if section == "Name":
+                    containername = values
+                elif isinstance(values, dict):
+                    for k, v in values.iteritems():
+                        if v not in [0, "None", None, "", [], {}]:
+                            newdict[k] = v
         return newdict, containername
 
     def dockerparamform(self, params):
-        dockerargs = ""
-        for keys in params.keys():
-            if type(params[keys]) == list:
-                # Has a list, needs to be parsed
-                for i in params[keys]:
-                    dockerargs = dockerargs + "--%s=%s " % (keys, i)
-            else:
-                dockerargs = dockerargs + "--%s=%s " % (keys, params[keys])
+        """Returns the --key=value arguments for params, one per list item"""
+        dockerargs = []
+        for keys in sorted(params):
+            values = params[keys] if type(params[keys]) == list else [params[keys]]
+            dockerargs.extend("--{0}={1}".format(keys, i) for i in values)
         return dockerargs
 
-    def dockerrun(self, params, image, containername):
-        dockercmd = params['dockercommand']
-        del params['dockercommand']
-        dockerargs = self.dockerparamform(params)
-        if self.remove == True:
-            dockerargs = dockerargs + ("{0}".format("--rm "))
-        dockerargs = dockerargs + ("--name={0}".format(containername))
-        print "docker %s %s %s %s" % (self.dockercommand, dockerargs, image, dockercmd)
+    def dockerargv(self, params, image, containername, detach=False):
+        """Builds the docker command line as a list, for use without a shell"""
+        params = dict(params)
+        dockercmd = params.pop('dockercommand', None) or []
+        params.pop('image', None)
+        argv = [self.docker]
+        if self.host:
+            argv.extend(["-H", self.host])
+        argv.append(self.dockercommand)
+        if detach:
+            # docker refuses --attach and --rm with --detach
+            params.pop('attach', None)
+            argv.append("--detach=true")
+        elif self.remove == True:
+            argv.append("--rm")
+        argv.extend(self.dockerparamform(params))
+        if containername:
+            argv.append("--name={0}".format(containername.lstrip('/')))
+        argv.append(image)
+        argv.extend(dockercmd)
+        return argv
+
+    def cliargv(self, params, detach=False):
+        """Returns the docker command line that runs a template"""
+        mydict, containername = self.stripParams(params)
+        image = mydict.get('Image')
+        if not image:
+            raise metadata.TemplateError("Template has no Config.Image")
+        return self.dockerargv(self.formfinaldict(mydict), image, containername, detach)
+
+    def execute(self, argv):
+        print " ".join(pipes.quote(arg) for arg in argv)
         print ""
-        os.system("docker %s %s %s %s" % (self.dockercommand, dockerargs, image, dockercmd))
+        try:
+            return subprocess.call(argv)
+        except OSError as e:
+            raise metadata.TemplateError("Unable to run {0}: {1}".format(self.docker, e))
+
+    def dockerrun(self, params, image, containername):
+        return self.execute(self.dockerargv(params, image, containername))
+
+    def run_cli(self):
+        """Runs the template through the docker CLI, returns its exit code"""
+        return self.execute(self.cliargv(load_template(self.jsonfile)))
 
     def containernameexists(self, name):
-        mycommand = "docker ps -a -q"
-        proc = subprocess.Popen([mycommand], stdout=subprocess.PIPE, shell=True)
-        out = proc.stdout.read()
-        containeruids = out.split()
-        insopen = "{{"
-        insclose = "}}"
-        for containers in containeruids:
-            inspect = ("docker inspect --format='{0}.Name{1}' {2}".format(insopen, insclose, containers))
-            proc = subprocess.Popen([inspect], stdout=subprocess.PIPE, shell=True)
-            containname = proc.stdout.read().rstrip('\n')
-            name = str(name)
-            if (containname == name):
-                return True
-        return False
-
-    def returnVolumeList(self, volumes):
-        if type(volumes) is not dict:
-            return None
-        vollist = []
-        for k, v in volumes.iteritems():
-            vollist.append(k)  # Changed from v to k
-        return vollist
-
-    def returnVolumeBinds(self, volumes, volumesrw):
-        if type(volumes) is not dict:
-            return None
-        voldict = {}
-        for k, v in volumes.iteritems():
-            # print k ## debug
-            if k in volumesrw:
-                perm = volumesrw[k]
-                # The docker-py API does this in inverse!
-                if perm is True:
-                    perm = False
-                else:
-                    perm = True
-                voldict[v] = {'bind': k, 'ro': perm}
-        return voldict
-
-    def returnPortList(self, djs):
-        portlist = []
-        portbind = {}
-        if djs.ports is not None:
-            for k, v in djs.ports.iteritems():
-                p = k.split("/")
-                portlist.append((int(p[0]), p[1]))
-                if type(v) != list:
-                    portbind[int(p[0])] = v
-                else:
-                    portbind[int(p[0])] = (v[0]['HostIp'], int(v[0]['HostPort']))
-            djs.portlist = portlist
-            djs.portbinding = portbind
-        else:
-            djs.portlist = None
-            djs.portbinding = None
+        return index.shared_containers().name_exists(name)
 
     def buildconfig(self, params, djs):
-        vollist = self.returnVolumeList(djs.volumes)
-        self.returnPortList(djs)
-        kwargs = {
-               'image': djs.image, 'command': djs.cmd, 'hostname': djs.hostname,
-                'user': djs.user, 'detach': False, 'stdin_open': False, 'tty': 'False',
-                'mem_limit': djs.mem_limit, 'ports': djs.portlist, 'environment': djs.environment,
-                'dns': djs.dns, 'volumes': vollist, 'volumes_from': djs.volumes_from,
-                'network_disabled': djs.network_disabled, 'name': djs.name,
-                'entrypoint': djs.entrypoint, 'cpu_shares': djs.cpu_shares,
-                'working_dir': djs.working_dir, 'domainname': djs.domainname,
-                'memswap_limit': djs.memswap_limit
-                }
-        return kwargs
-   
+        return dict(djs.create_kwargs)
 
     def buildrun(self, params, cid, djs):
-        volbinds = self.returnVolumeBinds(djs.volumes, djs.volumesrw)
-        kwargs = { 'container': cid, 'binds': volbinds, 'port_bindings': djs.portbinding, 'lxc_conf': djs.lxc_conf, 'publish_all_ports': djs.publish_all_ports, 'links': djs.links, 'privileged': djs.priviledged, 'dns': djs.dns, 'dns_search': djs.dns_search, 'volumes_from': djs.volumes_from, 'network_mode': djs.network_mode, 'restart_policy': djs.restart_policy, 'cap_add': djs.cap_add, 'cap_drop': djs.cap_drop }
-        return kwargs
+        return dict(djs.start_kwargs, container=cid)
 
+    def create(self, params, djs):
+        """Creates the container described by djs, returns its ID"""
+        kwargs = self.buildconfig(params, djs)
+        # We should add a debug options and wrap a conditional here
 
+        # for k,v in kwargs.iteritems():
+          #  print k, v
+        newcontainer = MakeDConnect().c.create_container(**kwargs)
+        return newcontainer['Id']
 
+    def start(self, params, cid, djs):
+        skwargs = self.buildrun(params, cid, djs)
+        # Debug 
+        # for k,v in skwargs.iteritems():
+          #  print k, v
+        MakeDConnect().c.start(**skwargs)
 
     def start_container(self):
         imagecommands = ImageFunctions()
-        dcons = MakeDConnect()
         djs = DockerJSON()
         params = self.load_json()
         djs.parsejson(params)
         djs.myvar = "foo"
         if not imagecommands.imageExistsByName(djs.configimage):
             print "Pulling image..."
-            dcons.c.pull(djs.configimage, insecure_registry = True)
-        kwargs = self.buildconfig(params, djs)
-        # We should add a debug options and wrap a conditional here
+            puller = pull.PullManager()
+            _, errors = puller.pull_missing([djs.configimage], imagecommands.imageindex)
+            puller.printsummary()
+            if errors:
+                raise metadata.TemplateError("Unable to pull {0}: {1}".format(djs.configimage, errors.values()[0]))
+        cid = self.create(params, djs)
+        print "Created new container {0}".format(cid)
+        self.start(params, cid, djs)
+
+        kwargs = {'cuid': cid[:8], 'outfile': None, 'directory': None, 'force': True}
+        create = metadata.Create(**kwargs)
+        create.write_files()
 
-        # for k,v in kwargs.iteritems():
-          #  print k, v
-        newcontainer = dcons.c.create_container(**kwargs)
-        print "Created new container {0}".format(newcontainer['Id'])
-        skwargs = self.buildrun(params, newcontainer['Id'], djs)
-        # Debug 
-        # for k,v in skwargs.iteritems():
-          #  print k, v
 
-        dcons.c.start(**skwargs)
+class Template(object):
+    """One loaded template of a BatchRun"""
 
-        kwargs = {'cuid': newcontainer['Id'][:8], 'outfile': None, 'directory': None, 'force': True}
-        create = metadata.Create(**kwargs)
-        create.write_files()
+    def __init__(self, path, params):
+        self.path = path
+        self.params = params
+        self.djs = DockerJSON()
+        try:
+            self.djs.parsejson(params)
+        except metadata.TemplateError as e:
+            raise metadata.TemplateError("{0}: {1}".format(path, e))
+        self.name = (self.djs.name or "").lstrip('/')
+        self.label = self.name or os.path.basename(path)
+        self.cid = None
+
+    def requires(self):
+        """Names of the containers this one links to or takes volumes from"""
+        names = set()
+        for link in self.djs.links or []:
+            names.add(link.split(':')[0].lstrip('/'))
+        for volumes in self.djs.volumes_from or []:
+            names.add(volumes.split(':')[0].lstrip('/'))
+        return names
+
+
+class BatchRun(Run):
+    """Runs many templates: pulls their images once, up front, then creates
+    and starts containers in waves so links and volumes-from containers
+    are up before the containers that need them
+
+    With backend "cli" each container is started by running docker run
+    --detach, without a shell, and its output and exit code are kept."""
 
+    def __init__(self, **kwargs):
+        super(BatchRun, self).__init__(**kwargs)
+        self.paths = kwargs['paths']
+        self.workers = kwargs.get('workers') or bulk.WORKERS
+        self.backend = kwargs.get('backend') or "api"
+        self.c = MakeDConnect().c
+        self.stages = bulk.Stages(self.workers)
+        self.failed = {}
+        self.cliresults = OrderedDict()
+
+    def fail(self, template, err):
+        print "Unable to run {0}: {1}".format(template.label, err)
+        self.failed[template.label] = err
+
+    def load(self):
+        templates = []
+        names = {}
+        for path, params in expand_templates(self.paths).items():
+            try:
+                template = Template(path, params)
+            except metadata.TemplateError as e:
+                self.failed[os.path.basename(path)] = e
+                print e
+                continue
+            if template.name and template.name in names:
+                self.fail(template, "name already used by {0}".format(names[template.name]))
+                continue
+            names[template.name] = path
+            templates.append(template)
+        return templates
+
+    def waves(self, templates):
+        """Orders templates into waves, returns (waves, deps, unplaced)
+
+        Every template is placed in a later wave than the templates it
+        requires. Dependencies outside the batch must already exist on
+        the host. Templates left unplaced depend on each other in a cycle."""
+        byname = dict((t.name, t) for t in templates if t.name)
+        deps = {}
+        for t in templates:
+            deps[t] = set(byname[name] for name in t.requires()
+                          if name in byname and byname[name] is not t)
+        waves = []
+        placed = set()
+        remaining = list(templates)
+        while remaining:
+            wave = [t for t in remaining if deps[t] <= placed]
+            if not wave:
+                break
+            waves.append(wave)
+            placed.update(wave)
+            remaining = [t for t in remaining if t not in placed]
+        return waves, deps, remaining
+
+    def pull(self, templates):
+        """Pulls each missing image once, returns the images that failed"""
+        refs = [t.djs.configimage for t in templates]
+        puller = pull.PullManager(self.c, self.workers)
+        start = time.time()
+        results, errors = puller.pull_missing(refs)
+        if results:
+            self.stages.record("pull", len(results) - len(errors), len(errors), time.time() - start)
+            for ref, err in errors.items():
+                print "Unable to pull {0}: {1}".format(ref, err)
+            puller.printsummary()
+        # Templates name the image as written, the puller by repo:tag
+        return set(ref for ref in refs if ref and pull.reference(ref) in errors)
+
+    def launch(self, template):
+        template.cid = self.create(template.params, template.djs)
+        return template.cid
+
+    def startone(self, template):
+        self.start(template.params, template.cid, template.djs)
+
+    def runcli(self, template):
+        """Runs docker run --detach for template, keeps its output"""
+        argv = self.cliargv(template.params, detach=True)
+        start = time.time()
+        try:
+            proc = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError as e:
+            raise metadata.TemplateError("Unable to run {0}: {1}".format(self.docker, e))
+        output, _ = proc.communicate()
+        lines = output.strip().splitlines()
+        self.cliresults[template.label] = (proc.returncode, time.time() - start, lines)
+        if proc.returncode != 0:
+            raise metadata.TemplateError("docker exited {0}: {1}".format(
+                proc.returncode, lines[-1] if lines else ""))
+        # docker run --detach prints the new container ID last
+        template.cid = lines[-1] if lines else None
+
+    def printcliresults(self):
+        print ""
+        print "{0:24} {1:>4} {2:>8}  {3}".format("Container", "Exit", "Seconds", "Output")
+        for label, (code, elapsed, lines) in self.cliresults.items():
+            print "{0:24} {1:4} {2:8.2f}  {3}".format(label[:24], code, elapsed, lines[-1][:60] if lines else "")
+
+    def start_containers(self):
+        """Runs every template, returns the number that failed"""
+        self.failed = {}
+        templates = self.load()
+        waves, deps, cyclic = self.waves(templates)
+        for t in cyclic:
+            self.fail(t, "links or volumes-from form a cycle")
+        pullerrors = set()
+        if self.backend == "api":
+            # docker run pulls for itself
+            pullerrors = self.pull([t for wave in waves for t in wave])
+        broken = set()
+        started = []
+        for num, wave in enumerate(waves):
+            ready = []
+            for t in wave:
+                if t.djs.configimage in pullerrors:
+                    self.fail(t, "image {0} was not pulled".format(t.djs.configimage))
+                elif deps[t] & broken:
+                    self.fail(t, "requires {0}, which did not start".format(
+                        ", ".join(sorted(d.label for d in deps[t] & broken))))
+                else:
+                    ready.append(t)
+                    continue
+                broken.add(t)
+            if not ready:
+                continue
+            label = " wave {0}".format(num + 1) if len(waves) > 1 else ""
+            if self.backend == "cli":
+                _, errors = self.stages.run("run", self.runcli, ready, "run" + label, key=lambda t: t.label)
+            else:
+                _, errors = self.stages.run("create", self.launch, ready, "create" + label, key=lambda t: t.label)
+                created = [t for t in ready if t.label not in errors]
+                starterrors = {}
+                if created:
+                    _, starterrors = self.stages.run("start", self.startone, created, "start" + label,
+                                                     key=lambda t: t.label)
+                errors.update(starterrors)
+            for t in ready:
+                if t.label in errors:
+                    self.failed[t.label] = errors[t.label]
+                    broken.add(t)
+                else:
+                    started.append(t)
+        if self.cliresults:
+            self.printcliresults()
+        elif started:
+            self.snapshot([t.cid for t in started])
+        self.stages.printsummary()
+        print ""
+        print "{0} started, {1} failed".format(len(started), len(self.failed))
+        return len(self.failed)
 
+    def snapshot(self, cids):
+        """Rewrites the templates of the started containers, as run does"""
+        batch = metadata.Batch(cuids=cids, force=True, directory=None, workers=self.workers)
+        inspects, _ = self.stages.run("inspect", self.c.inspect_container, cids, key=lambda cid: cid[:12])
+        inspected = [(cid, cins) for cid, cins in zip(cids, inspects) if cins is not None]
+        self.stages.run("snapshot", batch.snapshot, inspected, key=lambda pair: pair[0][:12])
+        batch.snapshotindex.save()
 
 
 class DockerJSON(object):
 
     def parsejson(self, params):
-        self.configimage = params[0]['Config']['Image'] if not "" else None 
-
-        # Container Create
-
-        """
-        self, image, command=None, hostname=None, user=None,
-                         detach=False, stdin_open=False, tty=False,
-                         mem_limit=0, ports=None, environment=None, dns=None,
-                         volumes=None, volumes_from=None,
-                         network_disabled=False, name=None, entrypoint=None,
-                         cpu_shares=None, working_dir=None, domainname=None,
-                         memswap_limit=0, cpuset=None):
-        """
-        self.image = params[0]['Config']['Image'] if not "" else None 
-        self.cmd = params[0]['Config']['Cmd'] if not "" else None 
-        self.hostname = params[0]['Config']['Hostname'] if not "" else None 
-        self.user = params[0]['Config']['User'] if not "" else None 
-        # detach
-        # stdin
-        # tty
-        self.mem_limit = params[0]['Config']['MemorySwap'] if not "" else None 
-        self.ports = params[0]['NetworkSettings']['Ports'] if not "" else None 
-        self.environment = params[0]['Config']['Env'] if not "" else None 
-        self.dns = params[0]['HostConfig']['Dns'] if not "" else None 
-        self.volumes = params[0]['Volumes'] if not "" else None 
-        self.volumes_from = params[0]['HostConfig']['VolumesFrom'] if not "" else None 
-        self.network_disabled = params[0]['Config']['NetworkDisabled'] if not "" else None 
-        self.name = params[0]['Name'] if not "" else None 
-        self.entrypoint = params[0]['Config']['Entrypoint'] if not "" else None 
-        self.cpu_shares = params[0]['Config']['CpuShares'] if not "" else None 
-        self.working_dir = params[0]['Config']['WorkingDir'] if not "" else None 
-        self.domainname = params[0]['Config']['Domainname'] if not "" else None 
-        self.memswap_limit = params[0]['Config']['MemorySwap'] if not "" else None 
-        self.cpuset = params[0]['Config']['Cpuset'] if not "" else None 
-
-        # Container Start
-
-        """
-        container, binds=None, port_bindings=None, lxc_conf=None,
-              publish_all_ports=False, links=None, privileged=False,
-              dns=None, dns_search=None, volumes_from=None, network_mode=None
-        """
-
-        # binds
-        self.binds = params[0]['HostConfig']['Binds'] if not "" else None 
-        self.port_bindings = params[0]['HostConfig']['PortBindings'] if not "" else None 
-        self.lxc_conf = params[0]['HostConfig']['LxcConf'] if not "" else None 
-        self.publish_all_ports = params[0]['HostConfig']['PublishAllPorts'] if not "" else None 
-        self.links = params[0]['HostConfig']['Links'] if not "" else None 
-        self.priviledged = params[0]['HostConfig']['Privileged'] if not "" else None 
-        self.dns_search = params[0]['HostConfig']['DnsSearch'] if not "" else None 
-        self.network_mode = params[0]['HostConfig']['NetworkMode'] if not "" else None 
-        self.restart_policy = params[0]['HostConfig']['RestartPolicy'] if not "" else None 
-        self.cap_add = params[0]['HostConfig']['CapAdd'] if not "" else None
-        self.cap_drop = params[0]['HostConfig']['CapDrop'] if not "" else None
-        self.volumesrw = params[0]['VolumesRW'] if not "" else None
+        """Reads a template through the translate field table
+
+        Sets every field as an attribute, plus create_kwargs and
+        start_kwargs for create_container() and start()."""
+        translation = translate.translate(params)
+        self.__dict__.update(translation.values)
+        self.configimage = translation.image
+        self.create_kwargs = translation.create
+        self.start_kwargs = translation.start
 
 
 class ImageFunctions(object):
+    def __init__(self):
+        self.imageindex = index.shared_images()
 
     def imageExistsByName(self, iname):
-        cons = MakeDConnect()
-        images = cons.c.images(name=None, quiet=False, all=True, viz=False)
-        for image in images:
-            for repo in image['RepoTags']:
-                if repo.startswith(iname):
-                    return True
-        return False
+        """True when iname (repo[:tag] or image ID) is present locally"""
+        return self.imageindex.exists(iname)
 
 
 class MakeDConnect(object):
     def __init__(self):
-        self.c = docker.Client(base_url='unix://var/run/docker.sock', version='1.12', timeout=10)
+        self.c = client.get_client()
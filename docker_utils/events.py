@@ -0,0 +1,193 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Container and image model kept current from the docker /events stream
+
+import httplib
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict
+import docker
+import requests
+from docker_utils import client, stream
+from docker_utils.index import UNTAGGED
+
+RECONNECT_DELAY = 2
+# What losing the daemon or the stream raises, anything else is a bug.
+# docker-py reads the stream from urllib3 directly, past requests.
+STREAM_ERRORS = (requests.exceptions.RequestException, requests.packages.urllib3.exceptions.HTTPError,
+                 httplib.HTTPException, docker.errors.APIError, socket.error)
+
+
+class HostModel(object):
+    """In-memory container and image listing
+
+    seed() lists containers and images once. start() then follows the
+    events stream on a background thread: container events re-inspect
+    that one container, image events refresh the image list."""
+
+    def __init__(self, c=None):
+        self.c = c or client.get_client()
+        self.lock = threading.Condition()
+        self._containers = OrderedDict()
+        self._images = OrderedDict()
+        self.since = None
+        self.generation = 0
+        self.stopped = False
+        self.thread = None
+
+    def seed(self):
+        now = int(time.time())
+        containers = self.c.containers(all=True)
+        images = self.c.images(all=True)
+        with self.lock:
+            self._containers = OrderedDict((c['Id'], c) for c in containers)
+            self._images = OrderedDict((i['Id'], i) for i in images)
+            self.since = now
+            self._changed()
+
+    def start(self):
+        if self.since is None:
+            self.seed()
+        self.thread = threading.Thread(target=self.listen)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+
+    def listen(self):
+        # The shared client times out idle reads, the stream must not
+        events = client.new_client(timeout=None)
+        while not self.stopped:
+            reason = "it ended"
+            try:
+                for event in stream.iterjson(events.events(since=self.since)):
+                    if self.stopped:
+                        return
+                    self.apply(event)
+            except STREAM_ERRORS as e:
+                reason = str(e) or e.__class__.__name__
+            if self.stopped:
+                return
+            # Stream dropped, events may have been missed
+            sys.stderr.write("Lost the docker events stream, {0}. Listing containers and images again\n".format(reason))
+            time.sleep(RECONNECT_DELAY)
+            try:
+                self.seed()
+            except STREAM_ERRORS as e:
+                sys.stderr.write("Unable to list containers and images: {0}\n".format(e))
+
+    def apply(self, event):
+        """Updates the model from one decoded event"""
+        status = event.get('status') or event.get('Action') or ""
+        eid = event.get('id') or event.get('Actor', {}).get('ID')
+        etype = event.get('Type') or ('container' if 'from' in event else 'image')
+        if event.get('time'):
+            self.since = event['time']
+        if etype == 'container' and eid:
+            self.update_container(eid, status)
+        elif etype == 'image':
+            self.update_images(eid, status)
+
+    def update_container(self, cid, status):
+        if status == 'destroy':
+            with self.lock:
+                self._pop(self._containers, cid)
+                self._changed()
+            return
+        try:
+            cins = self.c.inspect_container(cid)
+        except docker.errors.APIError:
+            with self.lock:
+                self._pop(self._containers, cid)
+                self._changed()
+            return
+        entry = self.listentry(cins)
+        with self.lock:
+            if entry['Id'] in self._containers:
+                self._containers[entry['Id']] = entry
+            else:
+                # docker lists the newest container first
+                items = [(entry['Id'], entry)] + self._containers.items()
+                self._containers = OrderedDict(items)
+            self._changed()
+
+    def update_images(self, iid, status):
+        if status == 'delete' and iid:
+            with self.lock:
+                self._pop(self._images, iid)
+                self._changed()
+            return
+        images = self.c.images(all=True)
+        with self.lock:
+            self._images = OrderedDict((i['Id'], i) for i in images)
+            self._changed()
+
+    def _pop(self, table, key):
+        for k in table.keys():
+            if k.startswith(key):
+                del table[k]
+
+    def _changed(self):
+        # Called with the lock held
+        self.generation += 1
+        self.lock.notify_all()
+
+    def wait(self, generation, timeout):
+        """Blocks until the model changes after generation or timeout passes"""
+        end = time.time() + timeout
+        with self.lock:
+            while self.generation == generation:
+                remaining = end - time.time()
+                if remaining <= 0:
+                    break
+                self.lock.wait(remaining)
+        return self.generation
+
+    def listentry(self, cins):
+        """Builds a containers() style entry from an inspect"""
+        state = cins.get('State') or {}
+        if state.get('Running'):
+            status = "Up (Paused)" if state.get('Paused') else "Up"
+        elif state.get('Restarting'):
+            status = "Restarting"
+        else:
+            status = "Exited ({0})".format(state.get('ExitCode', 0))
+        return {'Id': cins['Id'],
+                'Names': [cins.get('Name', '')],
+                'Image': cins['Config']['Image'],
+                'Command': ' '.join(cins['Config'].get('Cmd') or []),
+                'Status': status}
+
+    def containers(self, all=False):
+        with self.lock:
+            entries = self._containers.values()
+        if all:
+            return entries
+        return [c for c in entries if c['Status'].startswith('Up')]
+
+    def images(self, all=False):
+        with self.lock:
+            entries = self._images.values()
+        if all:
+            return entries
+        parents = set(i.get('ParentId') for i in entries)
+        return [i for i in entries
+                if not (i['Id'] in parents and (i.get('RepoTags') or [UNTAGGED]) == [UNTAGGED])]
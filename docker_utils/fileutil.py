@@ -0,0 +1,54 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Writing files whole, through a temporary file and a rename
+
+import os
+import tempfile
+from docker_utils import trace
+
+# Read once, os.umask can only be read by setting it, which would race
+# with files opened on other threads
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def atomic_stream(outname, render):
+    """Calls render(outfile) on a temporary file renamed to outname when
+    render returns, and returns what render returned"""
+    with trace.span("write", detail=outname) as span:
+        try:
+            fd, tmp = tempfile.mkstemp(prefix=".write-", dir=os.path.dirname(outname) or ".")
+        except (IOError, OSError) as e:
+            # Name the file asked for, not the temporary file
+            raise e.__class__(e.errno, e.strerror, outname)
+        try:
+            with os.fdopen(fd, "w") as outfile:
+                result = render(outfile)
+                span.bytes_out = outfile.tell()
+            # mkstemp creates 0600, give the mode open() would have
+            os.chmod(tmp, 0666 & ~UMASK)
+            os.rename(tmp, outname)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    return result
+
+
+def atomic_write(outname, data):
+    """Writes data to outname through a temporary file and a rename"""
+    atomic_stream(outname, lambda outfile: outfile.write(data))
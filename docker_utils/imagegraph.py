@@ -0,0 +1,119 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Image parent/child graph used to plan image deletion
+
+from collections import OrderedDict
+from docker_utils import index
+
+
+class ImageGraph(object):
+    """Image layer graph built once from images(all=True)
+
+    Holds parent to children adjacency and, given container inspects,
+    which containers use each image."""
+
+    def __init__(self, images, containers=None):
+        self.images = OrderedDict()
+        self.parent = {}
+        self.children = {}
+        self.containers = {}
+        for image in images:
+            self.images[image['Id']] = image
+        for iid, image in self.images.items():
+            parent = image.get('ParentId')
+            if parent and parent in self.images:
+                self.parent[iid] = parent
+                self.children.setdefault(parent, []).append(iid)
+        self.prefixes = index.PrefixIndex(self.images.keys())
+        for cins in containers or []:
+            self.add_container(cins)
+
+    def __len__(self):
+        return len(self.images)
+
+    def __contains__(self, iid):
+        return iid in self.images
+
+    def add_container(self, cins):
+        """Records a container inspect against the image it runs"""
+        iid = cins.get('ImageID') or cins.get('Image')
+        if iid in self.images:
+            self.containers.setdefault(iid, []).append(cins)
+
+    def resolve(self, iid):
+        """Returns the full ID for a full or partial image ID, or None"""
+        if iid in self.images:
+            return iid
+        return self.prefixes.resolve(iid)
+
+    def leaves(self):
+        return [iid for iid in self.images if not self.children.get(iid)]
+
+    def descendants(self, iid):
+        """Returns every image built on top of iid"""
+        found = []
+        stack = list(self.children.get(iid, []))
+        while stack:
+            child = stack.pop()
+            found.append(child)
+            stack.extend(self.children.get(child, []))
+        return found
+
+    def deletion_plan(self, iids):
+        """Returns iids and their descendants ordered leaves first
+
+        Every image appears once, even when it descends from several of
+        the given images, and always before its parent."""
+        seen = set()
+        plan = []
+        for root in iids:
+            stack = [(root, False)]
+            while stack:
+                iid, expanded = stack.pop()
+                if expanded:
+                    plan.append(iid)
+                    continue
+                if iid in seen or iid not in self.images:
+                    continue
+                seen.add(iid)
+                stack.append((iid, True))
+                for child in self.children.get(iid, []):
+                    if child not in seen:
+                        stack.append((child, False))
+        return plan
+
+    def containers_for(self, iids):
+        """Returns the inspects of containers using any of iids"""
+        found = []
+        for iid in iids:
+            found.extend(self.containers.get(iid, []))
+        return found
+
+    def discard(self, iids):
+        """Drops removed images from the graph"""
+        for iid in iids:
+            if iid not in self.images:
+                continue
+            del self.images[iid]
+            parent = self.parent.pop(iid, None)
+            if parent is not None:
+                self.children[parent].remove(iid)
+            for child in self.children.pop(iid, []):
+                del self.parent[child]
+            self.containers.pop(iid, None)
+        self.prefixes = index.PrefixIndex(self.images.keys())
@@ -0,0 +1,275 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# In-memory lookup tables built from a single docker API listing
+
+import bisect
+import re
+import time
+from docker_utils import client
+
+SHORT_ID_LEN = 12
+UNTAGGED = '<none>:<none>'
+
+
+class AmbiguousPrefixError(Exception):
+    def __init__(self, prefix, candidates):
+        self.prefix = prefix
+        self.candidates = candidates
+        Exception.__init__(self, "'{0}' matches several IDs: {1}".format(
+            prefix, ", ".join(c[:SHORT_ID_LEN] for c in candidates)))
+
+
+class PrefixIndex(object):
+    """Sorted ID array answering prefix lookups in O(log n)"""
+
+    def __init__(self, ids):
+        self.ids = sorted(set(ids))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def matches(self, prefix):
+        """Returns every ID starting with prefix"""
+        pos = bisect.bisect_left(self.ids, prefix)
+        found = []
+        while pos < len(self.ids) and self.ids[pos].startswith(prefix):
+            found.append(self.ids[pos])
+            pos += 1
+        return found
+
+    def resolve(self, prefix):
+        """Returns the only ID starting with prefix or None
+
+        Raises AmbiguousPrefixError when more than one ID matches"""
+        pos = bisect.bisect_left(self.ids, prefix)
+        if pos == len(self.ids) or not self.ids[pos].startswith(prefix):
+            return None
+        if pos + 1 < len(self.ids) and self.ids[pos + 1].startswith(prefix):
+            raise AmbiguousPrefixError(prefix, self.matches(prefix))
+        return self.ids[pos]
+
+    def shortest_unique(self, fullid, minimum=SHORT_ID_LEN):
+        """Returns the shortest prefix of fullid, at least minimum long,
+        that no other ID shares"""
+        pos = bisect.bisect_left(self.ids, fullid)
+        shared = 0
+        for neighbour in (pos - 1, pos + 1):
+            if 0 <= neighbour < len(self.ids):
+                other = self.ids[neighbour]
+                common = 0
+                while common < min(len(other), len(fullid)) and other[common] == fullid[common]:
+                    common += 1
+                shared = max(shared, common)
+        return fullid[:max(minimum, shared + 1)]
+
+
+class Listing(object):
+    """Base for lookup tables built from one docker API listing
+
+    With a ttl (seconds) the listing is re-fetched once it is older than
+    ttl, without one it is kept until refresh() or invalidate() is
+    called. Without a client the shared one is used."""
+
+    def __init__(self, c=None, ttl=None):
+        self.c = c
+        self.ttl = ttl
+        self._built = None
+
+    @property
+    def client(self):
+        return self.c or client.get_client()
+
+    def invalidate(self):
+        self._built = None
+
+    def refresh(self):
+        """Re-fetches the listing, subclasses set _built"""
+        raise NotImplementedError
+
+    @property
+    def stale(self):
+        if self._built is None:
+            return True
+        if self.ttl is None:
+            return False
+        return time.time() - self._built > self.ttl
+
+    def _check(self):
+        if self.stale:
+            self.refresh()
+
+
+class ContainerIndex(Listing):
+    """Container lookup by name, short ID or full ID
+
+    Built from one containers(all=True) call, see Listing."""
+
+    def __init__(self, c=None, ttl=None):
+        Listing.__init__(self, c, ttl)
+        self._containers = []
+        self._index = {}
+        self._names = set()
+        self._prefixes = PrefixIndex([])
+
+    def refresh(self):
+        self.load(self.client.containers(all=True))
+
+    def load(self, containers):
+        """Builds the index from a containers(all=True) listing at hand,
+        e.g. one kept up to date from the events stream"""
+        index = {}
+        names = set()
+        for container in containers:
+            cid = container['Id']
+            index[cid] = container
+            index[cid[:SHORT_ID_LEN]] = container
+            for name in container.get('Names') or []:
+                # Link aliases look like /web/db, only index real names
+                if '/' in name.lstrip('/'):
+                    continue
+                index[name] = container
+                index[name.lstrip('/')] = container
+                names.add(name.lstrip('/'))
+        self._containers = containers
+        self._index = index
+        self._names = names
+        self._prefixes = PrefixIndex([container['Id'] for container in containers])
+        self._built = time.time()
+
+    @property
+    def containers(self):
+        self._check()
+        return self._containers
+
+    @property
+    def ids(self):
+        return [container['Id'] for container in self.containers]
+
+    @property
+    def prefixes(self):
+        self._check()
+        return self._prefixes
+
+    def lookup(self, key):
+        """Returns the list entry for a name, short or full ID, else None"""
+        self._check()
+        return self._index.get(key)
+
+    def name_exists(self, name):
+        self._check()
+        return str(name).lstrip('/') in self._names
+
+    def __contains__(self, key):
+        return self.lookup(key) is not None
+
+
+def split_tag(ref):
+    """Splits an image reference into repository and tag, tag defaults to latest"""
+    repo, sep, tag = ref.rpartition(':')
+    if not sep or '/' in tag:
+        # No tag, the colon belonged to a registry port
+        return ref, 'latest'
+    return repo, tag
+
+
+class ImageIndex(Listing):
+    """Image lookup by repository, repo:tag, full ID and short ID
+
+    Built from one images(all=True) call, see Listing. Invalidate it
+    after pulling or removing images."""
+
+    def __init__(self, c=None, ttl=None):
+        Listing.__init__(self, c, ttl)
+        self._images = []
+        self._index = {}
+        self._repos = {}
+        self._prefixes = PrefixIndex([])
+
+    def refresh(self):
+        images = self.client.images(name=None, quiet=False, all=True, viz=False)
+        index = {}
+        repos = {}
+        for image in images:
+            iid = image['Id']
+            index[iid] = image
+            index[iid[:SHORT_ID_LEN]] = image
+            for tag in image.get('RepoTags') or []:
+                if tag == UNTAGGED:
+                    continue
+                index[tag] = image
+                repos.setdefault(split_tag(tag)[0], []).append(image)
+        self._images = images
+        self._index = index
+        self._repos = repos
+        self._prefixes = PrefixIndex([image['Id'] for image in images])
+        self._built = time.time()
+
+    @property
+    def images(self):
+        self._check()
+        return self._images
+
+    @property
+    def prefixes(self):
+        self._check()
+        return self._prefixes
+
+    def lookup(self, ref):
+        """Returns the image for repo[:tag] or a full, short or partial ID
+
+        A reference without a tag means :latest, as for docker run."""
+        self._check()
+        if ref in self._index:
+            return self._index[ref]
+        repo, tag = split_tag(ref)
+        image = self._index.get("{0}:{1}".format(repo, tag))
+        if image is None and re.match('^[0-9a-f]{3,}$', ref):
+            try:
+                iid = self._prefixes.resolve(ref)
+            except AmbiguousPrefixError:
+                iid = None
+            image = self._index.get(iid)
+        return image
+
+    def exists(self, ref):
+        return self.lookup(ref) is not None
+
+    def repository(self, repo):
+        """Returns every image tagged in repo"""
+        self._check()
+        return list(self._repos.get(repo, []))
+
+    def __contains__(self, ref):
+        return self.exists(ref)
+
+
+_shared = {}
+
+
+def shared_images():
+    """Returns the process-wide ImageIndex on the shared client"""
+    if 'images' not in _shared:
+        _shared['images'] = ImageIndex()
+    return _shared['images']
+
+
+def shared_containers():
+    """Returns the process-wide ContainerIndex on the shared client"""
+    if 'containers' not in _shared:
+        _shared['containers'] = ContainerIndex()
+    return _shared['containers']
@@ -0,0 +1,229 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Streaming container logs with bounded memory
+
+import Queue
+import struct
+import sys
+import threading
+from collections import deque
+from docker_utils import bulk, client
+
+# Lines kept for scroll-back
+RING_SIZE = 1000
+# Lines shown from the end of the log when not told otherwise
+TAIL = 100
+# Longer lines are cut, so a log without newlines cannot fill memory
+MAX_LINE = 64 * 1024
+READ_SIZE = 4096
+# Lines waiting to be printed; readers block once it is full
+QUEUE_SIZE = 1000
+
+# Multiplexed log frames start with the stream, three pad bytes and the size
+HEADER = struct.Struct('>BxxxL')
+STREAMS = {0: 'stdin', 1: 'stdout', 2: 'stderr'}
+
+
+def readexact(raw, size):
+    data = ""
+    while len(data) < size:
+        chunk = raw.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def frames(raw, tty=False):
+    """Yields (stream, data) read incrementally from a logs response
+
+    Without a tty docker multiplexes stdout and stderr into frames. With a
+    tty the output is one raw stream, read READ_SIZE bytes at a time."""
+    if tty:
+        while True:
+            data = raw.read(READ_SIZE)
+            if not data:
+                return
+            yield 'stdout', data
+    while True:
+        header = readexact(raw, HEADER.size)
+        if len(header) < HEADER.size:
+            return
+        stream, size = HEADER.unpack(header)
+        # A large frame is yielded in pieces rather than read whole
+        while size > 0:
+            data = raw.read(min(size, READ_SIZE))
+            if not data:
+                return
+            size -= len(data)
+            yield STREAMS.get(stream, 'stdout'), data
+
+
+def lines(chunks):
+    """Yields (stream, line) from (stream, data) chunks
+
+    Keeps one partial line per stream. Lines over MAX_LINE are cut."""
+    partial = {}
+    for stream, data in chunks:
+        buf = partial.get(stream, "") + data
+        parts = buf.split("\n")
+        buf = parts.pop()
+        for line in parts:
+            yield stream, line
+        while len(buf) > MAX_LINE:
+            yield stream, buf[:MAX_LINE]
+            buf = buf[MAX_LINE:]
+        partial[stream] = buf
+    for stream, buf in partial.items():
+        if buf:
+            yield stream, buf
+
+
+class LogStream(object):
+    """The log of one container read as it arrives
+
+    tail and since are sent to the daemon; older daemons ignore them, so
+    tail is also applied here when not following."""
+
+    def __init__(self, c, cid, tail=TAIL, since=None, follow=False, tty=False):
+        self.c = c
+        self.cid = cid
+        self.tail = tail
+        self.since = since
+        self.follow = follow
+        self.tty = tty
+        self.response = None
+
+    def open(self):
+        params = {'stdout': 1, 'stderr': 1, 'follow': 1 if self.follow else 0,
+                  'tail': self.tail if self.tail is not None else 'all'}
+        if self.since is not None:
+            params['since'] = int(self.since)
+        url = self.c._url("/containers/{0}/logs".format(self.cid))
+        self.response = self.c._get(url, params=params, stream=True)
+        self.c._raise_for_status(self.response)
+        return self.response
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+
+    def __iter__(self):
+        self.open()
+        found = lines(frames(self.response.raw, self.tty))
+        if self.follow or self.tail in (None, 'all'):
+            return found
+        return iter(deque(found, maxlen=int(self.tail)))
+
+
+class LogView(object):
+    """Prints the logs of one or more containers as they arrive
+
+    Each container is read on its own thread. Lines from several
+    containers are interleaved and prefixed with the container name. The
+    last ring lines printed are kept for scroll-back."""
+
+    def __init__(self, cids, tail=TAIL, since=None, follow=False, ring=RING_SIZE, c=None):
+        self.cids = cids
+        self.tail = tail
+        self.since = since
+        self.follow = follow
+        self.ring = deque(maxlen=ring)
+        # Following must not time out on a quiet container
+        self.c = c or (client.new_client(timeout=None) if follow else client.get_client())
+        self.streams = []
+        self.stopped = False
+
+    def labels(self):
+        """Returns {cid: (name, tty)} from one concurrent inspect per container"""
+        inspects, errors = bulk.inspect_containers(self.c, self.cids)
+        for cid, err in errors.items():
+            print "Unable to read the log of {0}: {1}".format(cid[:12], err)
+        found = {}
+        for cid, cins in zip(self.cids, inspects):
+            if cins is not None:
+                name = cins.get('Name', '').lstrip('/') or cid[:12]
+                found[cid] = (name, bool(cins['Config'].get('Tty')))
+        return found
+
+    def reader(self, stream, name, queue):
+        try:
+            for source, line in stream:
+                if self.stopped:
+                    break
+                queue.put((name, source, line))
+        except Exception as e:
+            if not self.stopped:
+                queue.put((name, 'stderr', "log stream failed: {0}".format(e)))
+        finally:
+            queue.put((name, None, None))
+
+    def show(self, name, source, line, prefix):
+        if prefix:
+            line = "{0} | {1}".format(name, line)
+        self.ring.append(line)
+        sys.stdout.write(line + "\n")
+
+    def run(self):
+        """Prints until every log ends, or until Ctrl-C when following"""
+        labels = self.labels()
+        if not labels:
+            return
+        prefix = len(labels) > 1
+        queue = Queue.Queue(QUEUE_SIZE)
+        self.stopped = False
+        self.streams = []
+        for cid, (name, tty) in labels.items():
+            stream = LogStream(self.c, cid, self.tail, self.since, self.follow, tty)
+            self.streams.append(stream)
+            t = threading.Thread(target=self.reader, args=(stream, name, queue))
+            t.daemon = True
+            t.start()
+        running = len(self.streams)
+        try:
+            while running:
+                try:
+                    # A timeout keeps the wait interruptible by Ctrl-C
+                    name, source, line = queue.get(timeout=1)
+                except Queue.Empty:
+                    continue
+                if source is None:
+                    running -= 1
+                    continue
+                self.show(name, source, line, prefix)
+        except KeyboardInterrupt:
+            print ""
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stopped = True
+        for stream in self.streams:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def scrollback(self, page):
+        """Returns the ring as pages of page lines, newest page first"""
+        kept = list(self.ring)
+        pages = []
+        while kept:
+            pages.append(kept[-page:])
+            kept = kept[:-page]
+        return pages
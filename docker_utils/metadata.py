@@ -15,15 +15,157 @@
 # Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 # Boston, MA 02111-1307, USA.
 
+import cgi
+import hashlib
 import os
+import sys
 import subprocess
 import json
-import re
+import threading
+import urllib2
+import urlparse
+import time
+from collections import OrderedDict
 from string import Template
-import docker
+from docker_utils import bulk, catalog, client, diff, fileutil, index
+from docker_utils.templates import TemplateError
 
 USER_TEMPLATE_DIR = "/var/container-template/user/"
 SYSTEM_TEMPLATE_DIR = "/var/container-template/system/"
+TEMPLATE_DIRS = [USER_TEMPLATE_DIR, SYSTEM_TEMPLATE_DIR]
+WORKERS = bulk.WORKERS
+# Pull keeps the ETag and Last-Modified of fetched URLs here
+PULL_CACHE = ".pull-cache.json"
+PULL_TIMEOUT = 30
+CHUNK_SIZE = 64 * 1024
+# Create keeps the hash of every file it writes here
+SNAPSHOT_INDEX = ".snapshot-index.json"
+WRITTEN = "written"
+UNCHANGED = "unchanged"
+SKIPPED = "skipped"
+# Inspect values that change whenever a container restarts, not drift
+DRIFT_IGNORE = ['/State', '/Created', '/NetworkSettings', '/RestartCount', '/LogPath', '/ExecIDs']
+IN_SYNC = "in sync"
+DRIFTED = "drifted"
+NO_TEMPLATE = "no template"
+# Containers inspected at a time by KubeList
+KUBE_CHUNK = 256
+
+
+def sanitize(cins):
+    """Blanks the host specific values of an inspect, in place"""
+    cins['HostsPath'] = ""
+    cins['Image'] = ""
+    cins['State']['FinishedAt'] = ""
+    cins['State']['StartedAt'] = ""
+    cins['ResolvConfPath'] = ""
+    cins['HostnamePath'] = ""
+    cins['Config']['Hostname'] = ""
+    cins['Id'] = ""
+    # cins['Name'] = ""
+    return cins
+
+
+def resolve_container(containerindex, cuid):
+    """Returns the full ID of a container name, ID or ID prefix
+
+    The listing is fetched again once before giving up, a long lived
+    index may predate the container. Raises TemplateError."""
+    for attempt in range(2):
+        container = containerindex.lookup(cuid)
+        if container is not None:
+            return container['Id']
+        if len(cuid) < 3:
+            raise TemplateError("Container ID must be at least 3 characters")
+        try:
+            match = containerindex.prefixes.resolve(cuid)
+        except index.AmbiguousPrefixError as e:
+            raise TemplateError("{0}. Give more characters.".format(e))
+        if match is not None:
+            return match
+        if attempt == 0:
+            containerindex.refresh()
+    raise TemplateError("Unable to find container ID '%s'. Try 'docker ps'." % cuid)
+
+
+def kube_pod(name, containers, vols):
+    """A v1beta1 Pod running containers, see Create.kube_container"""
+    return {
+        "kind": "Pod",
+        "id": name,
+        "labels": {"name": name},
+        "apiVersion": "v1beta1",
+        "namespace": None,
+        "creationTimestamp": None,
+        "selfLink": None,
+        "desiredState": {
+            "manifest": {
+                "version": "v1beta1",
+                "id": None,
+                "containers": containers,
+                "volumes": vols
+            }
+        }
+    }
+
+
+class SnapshotIndex(object):
+    """Hashes of the files Create wrote to one directory
+
+    Kept in a file in the directory together with the size and mtime of
+    each file as written, so an unchanged file is recognised without
+    reading it. A file modified since is hashed from disk instead."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.indexfile = os.path.join(directory, SNAPSHOT_INDEX)
+        self._hashes = None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self._hashes is None:
+                try:
+                    with open(self.indexfile) as f:
+                        self._hashes = json.load(f)
+                except (IOError, ValueError):
+                    self._hashes = {}
+            return self._hashes
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            with self.lock:
+                data = json.dumps(self._hashes)
+                self.dirty = False
+            fileutil.atomic_write(self.indexfile, data)
+        except (IOError, OSError):
+            # A directory we may not write to, files are then hashed from disk
+            pass
+
+    def current(self, path):
+        """Hash of the file at path, None when there is no file"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        entry = self.load().get(os.path.basename(path))
+        if entry and entry[1:] == [st.st_size, st.st_mtime]:
+            return entry[0]
+        try:
+            with open(path) as f:
+                return hashlib.sha1(f.read()).hexdigest()
+        except IOError:
+            return None
+
+    def record(self, path, digest):
+        st = os.stat(path)
+        self.load()
+        with self.lock:
+            self._hashes[os.path.basename(path)] = [digest, st.st_size, st.st_mtime]
+            self.dirty = True
 
 
 class Create(object):
@@ -32,7 +174,16 @@ class Create(object):
         self.force = kwargs['force']
         self.outfile = kwargs['outfile']
         self.directory = kwargs['directory']
-        self.c = docker.Client(base_url='unix://var/run/docker.sock', version='1.12', timeout=10)
+        self.c = client.get_client()
+        self.containerindex = kwargs.get('containerindex') or index.shared_containers()
+        # Batch shares one index per directory and saves it once
+        self.ownindex = kwargs.get('snapshotindex') is None
+        self.snapshotindex = kwargs.get('snapshotindex') or SnapshotIndex(self.outdir)
+        self._container_json = None
+        if kwargs.get('inspect'):
+            # Already inspected by the caller
+            self.cuid = kwargs['inspect']['Id']
+            self._container_json = sanitize(kwargs['inspect'])
 
     def outfileexists(self, outname):
         if os.path.isfile(outname):
@@ -59,40 +210,37 @@ class Create(object):
         return mydict
 
     def checkcontaineruid(self):
-        """Checks ID and returns valid containeruid. Accepts partial UID"""
-        containers = self.c.containers(all=True)
-        containeruids = []
-
-        # Create container list, keeps ABI with previous use without API
+        """Checks ID and returns valid containeruid. Accepts partial UID or name"""
+        return resolve_container(self.containerindex, self.cuid)
 
-        for container in containers:
-            containeruids.append(container['Id'])
-        if not len(self.cuid) >= 3:
-            print "Container ID must be at least 3 characters"
-            quit(1)
-        else:
-            match = [containeruid for containeruid in containeruids if re.match(self.cuid, containeruid)]
-            if match:
-                return match[0]
-            else:
-                print "Unable to find container ID '%s'. Try 'docker ps'." % self.cuid
-                quit(1)
+    @property
+    def outdir(self):
+        return self.directory or USER_TEMPLATE_DIR
 
     def writeoutput(self, vals, outname, filetype="json"):
-        if not self.directory:
-            outname = USER_TEMPLATE_DIR + outname
+        """Writes outname if its content changed, returns WRITTEN, UNCHANGED or SKIPPED
+
+        JSON is rendered with sorted keys, so the same content always
+        renders, and hashes, the same. A file that differs is only
+        replaced with force, and is otherwise SKIPPED."""
+        outname = os.path.join(self.outdir, outname.lstrip("/"))
+        if filetype == "json":
+            data = json.dumps(vals, indent=2, sort_keys=True)
         else:
-            outname = self.directory + outname
-        if (not self.force) and (self.outfileexists(outname)):
-            print ("{0} already exists. Pass -f or --force to override".format(outname))
-            quit(1)
-        with open(outname, "w") as outfile:
-            if filetype is "json":
-                json.dump(vals, outfile, indent=2)
-            else:
-                outfile.write(vals)
-        outfile.closed
-        print outname
+            data = vals.encode('utf-8') if isinstance(vals, unicode) else vals
+        digest = hashlib.sha1(data).hexdigest()
+        current = self.snapshotindex.current(outname)
+        # One write per line, so lines from concurrent snapshots do not interleave
+        if current == digest:
+            sys.stdout.write("{0} is unchanged\n".format(outname))
+            return UNCHANGED
+        if current is not None and not self.force:
+            sys.stdout.write("{0} already exists. Pass -f or --force to override\n".format(outname))
+            return SKIPPED
+        fileutil.atomic_write(outname, data)
+        self.snapshotindex.record(outname, digest)
+        sys.stdout.write(outname + "\n")
+        return WRITTEN
 
     @property
     def outname(self):
@@ -150,24 +298,21 @@ class Create(object):
 
         return { "left": left, "right": right }
 
+    def refresh(self):
+        """Drops the cached inspect, the next access resolves the ID again"""
+        self._container_json = None
+        self.containerindex.invalidate()
+
     @property
     def container_json(self):
-        self.cuid = self.checkcontaineruid()
-        cins = self.c.inspect_container(self.cuid)
-
-        # Remove certain entries
-        cins['HostsPath'] = ""
-        cins['Image'] = ""
-        cins['State']['FinishedAt'] = ""
-        cins['State']['StartedAt'] = ""
-        cins['ResolvConfPath'] = ""
-        cins['HostnamePath'] = ""
-        cins['Config']['Hostname'] = ""
-        cins['Id'] = ""
-        # cins['Name'] = ""
-
-        return cins
+        """Inspect of the container with host specific values blanked
 
+        Resolved and inspected once per instance, see refresh()"""
+        if self._container_json is not None:
+            return self._container_json
+        self.cuid = self.checkcontaineruid()
+        self._container_json = sanitize(self.c.inspect_container(self.cuid))
+        return self._container_json
 
     def metadata_file(self):
         # FIXME: populate these values
@@ -176,19 +321,24 @@ class Create(object):
                                    }}
 
         vals = [self.container_json, userdict]
-        self.writeoutput(vals, self.outname)
+        return self.writeoutput(vals, self.outname)
 
     def kubernetes_file(self):
-        # FIXME: support list of containers
         kube_file = self.outname.replace('.json', '-pod.json')
+        container, vols = self.kube_container()
+        pod = kube_pod(self.container_json['Name'], [container], vols)
+        return self.writeoutput(pod, kube_file)
+
+    def kube_container(self):
+        """Returns this container and its volumes as in a pod manifest"""
         env = []
-        for e in self.container_json['Config']['Env']:
-            k,v = e.split('=')
+        for e in self.container_json['Config']['Env'] or []:
+            k,v = e.split('=', 1)
             env.append({ "name": k, "value": v })
 
         volumeMounts = []
         vols = []
-        for k,v in self.container_json['Volumes'].iteritems():
+        for k,v in (self.container_json['Volumes'] or {}).iteritems():
             name = v.replace('/', '')
             volumeMounts.append({ "name": name,
                                   "readOnly": self.container_json["VolumesRW"][k],
@@ -204,35 +354,15 @@ class Create(object):
                     # FIXME: support list of host ports
                     ports.append({ "containerPort": port,
                                    "hostPort": v[0]['HostPort'] })
-        pod = self.kube_pod(env=env, volumeMounts=volumeMounts, vols=vols, ports=ports)
-        self.writeoutput(pod, kube_file)
-
-    def kube_pod(self, **kwargs):
-    #def kube_pod(self, env=None, volumeMounts=None, vols=None, ports=None):
-        return {
-            "kind": "Pod",
-            "id": self.container_json['Name'],
-            "labels": { "name": self.container_json['Name']},
-            "apiVersion": "v1beta1",
-            "namespace": None,
-            "creationTimestamp": None,
-            "selfLink": None,
-            "desiredState": {
-              "manifest": {
-                "version": "v1beta1",
-                "id": None,
-                "containers": [{
-                  "name": self.container_json['Name'],
-                  "image": self.container_json['Config']['Image'],
-                  "command": self.container_json['Config']['Cmd'],
-                  "env": kwargs['env'],
-                  "ports": kwargs['ports'],
-                  "volumeMounts": kwargs['volumeMounts']
-                }],
-                "volumes": kwargs['vols']
-              }
-            }
+        container = {
+            "name": self.container_json['Name'],
+            "image": self.container_json['Config']['Image'],
+            "command": self.container_json['Config']['Cmd'],
+            "env": env,
+            "ports": ports,
+            "volumeMounts": volumeMounts
         }
+        return container, vols
 
     @property
     def sysd_unit_template(self):
@@ -260,79 +390,465 @@ WantedBy=multi-user.target
         template = Template(self.sysd_unit_template)
         template = template.substitute(repl_dict)
         unit_filename = self.outname.replace('.json', '.service')
-        self.writeoutput(template, unit_filename, "text")
+        return self.writeoutput(template, unit_filename, "text")
+
+    def write_files(self):
+        """Writes the three files, returns the status of each"""
+        try:
+            return [self.metadata_file(), self.kubernetes_file(), self.sysd_unit_file()]
+        finally:
+            if self.ownindex:
+                self.snapshotindex.save()
+
+
+class Batch(object):
+    """Snapshots many containers with a bounded pool of worker threads"""
+
+    def __init__(self, **kwargs):
+        self.cuids = kwargs.get('cuids') or []
+        self.all = kwargs.get('all', False)
+        self.filters = kwargs.get('filters') or []
+        self.force = kwargs.get('force', False)
+        self.directory = kwargs.get('directory')
+        self.workers = kwargs.get('workers') or WORKERS
+        self.c = client.get_client()
+        self.containerindex = index.shared_containers()
+        self.snapshotindex = SnapshotIndex(self.directory or USER_TEMPLATE_DIR)
+
+    def container_status(self, container):
+        status = container.get('Status') or ""
+        if status.startswith('Up'):
+            return "paused" if "(Paused)" in status else "running"
+        elif status.startswith('Exited'):
+            return "exited"
+        elif status.startswith('Restarting'):
+            return "restarting"
+        return "created"
+
+    def matches(self, container, filt):
+        if '=' not in filt:
+            raise TemplateError("Filter '{0}' must look like status=running or label=key[=value]".format(filt))
+        key, value = filt.split('=', 1)
+        if key == "status":
+            return self.container_status(container) == value
+        elif key == "label":
+            labels = container.get('Labels') or {}
+            if '=' in value:
+                lkey, lvalue = value.split('=', 1)
+                return labels.get(lkey) == lvalue
+            return value in labels
+        raise TemplateError("Unsupported filter '{0}'. Use status or label".format(key))
+
+    def select(self):
+        """Returns the container IDs to snapshot and the lookup failures"""
+        errors = {}
+        if self.all or not self.cuids:
+            containers = self.containerindex.containers
+        else:
+            containers = []
+            for cuid in self.cuids:
+                try:
+                    containers.append(self.containerindex.lookup(resolve_container(self.containerindex, cuid)))
+                except TemplateError as e:
+                    errors[cuid] = e
+        selected = []
+        for container in containers:
+            if all(self.matches(container, f) for f in self.filters):
+                if container['Id'] not in selected:
+                    selected.append(container['Id'])
+        return selected, errors
+
+    def snapshot(self, inspected):
+        cuid, cins = inspected
+        kwargs = {'cuid': cuid,
+                  'outfile': None,
+                  'directory': self.directory,
+                  'force': self.force,
+                  'containerindex': self.containerindex,
+                  'snapshotindex': self.snapshotindex,
+                  'inspect': cins}
+        return Create(**kwargs).write_files()
+
+    def result(self, statuses):
+        if SKIPPED in statuses:
+            return "skipped, pass --force to overwrite"
+        return WRITTEN if WRITTEN in statuses else UNCHANGED
 
     def write_files(self):
-        self.metadata_file()
-        self.kubernetes_file()
-        self.sysd_unit_file()
+        """Snapshots every selected container
+
+        Returns the number of containers that failed or had files skipped."""
+        cuids, errors = self.select()
+        if not cuids and not errors:
+            print "No containers selected"
+            return 0
+        start = time.time()
+        inspects, inspecterrors = bulk.inspect_containers(self.c, cuids, self.workers)
+        errors.update(inspecterrors)
+        inspected = [(cuid, cins) for cuid, cins in zip(cuids, inspects) if cins is not None]
+        results, writeerrors = bulk.run(self.snapshot, inspected, self.workers, key=lambda pair: pair[0])
+        self.snapshotindex.save()
+        errors.update(writeerrors)
+        written = dict((cuid, statuses) for (cuid, _), statuses in zip(inspected, results) if statuses)
+        print ""
+        print "{0:12} {1}".format("Container", "Result")
+        for cuid in cuids + [cuid for cuid in errors if cuid not in cuids]:
+            err = errors.get(cuid)
+            if err is None:
+                result = self.result(written[cuid])
+            else:
+                result = "FAILED: " + (str(err) or err.__class__.__name__)
+            print "{0:12} {1}".format(cuid[:12], result)
+        statuses = sum(written.values(), [])
+        skipped = len([s for s in written.values() if SKIPPED in s])
+        print ""
+        print "{0} snapshotted, {1} failed in {2:.2f}s: {3} files written, {4} unchanged, {5} skipped".format(
+            len(written), len(errors), time.time() - start,
+            statuses.count(WRITTEN), statuses.count(UNCHANGED), statuses.count(SKIPPED))
+        return len(errors) + skipped
+
+
+class Drift(Batch):
+    """Compares containers with the templates saved from them
+
+    Containers are selected as for Batch and inspected concurrently. Both
+    sides are sanitized the way Create saves them, a template shared by
+    several containers is loaded once, and a container whose normalized
+    inspect hashes the same as its template is not diffed."""
+
+    def __init__(self, **kwargs):
+        Batch.__init__(self, **kwargs)
+        dirs = [self.directory] if self.directory else TEMPLATE_DIRS
+        self.catalog = kwargs.get('catalog') or catalog.shared(dirs)
+        self.ignore = DRIFT_IGNORE + (kwargs.get('ignore') or [])
+        self.baselines = {}
+
+    def baseline(self, path):
+        if path not in self.baselines:
+            try:
+                with open(path) as f:
+                    params = json.load(f)
+                doc = params[0]
+                self.baselines[path] = diff.Baseline(sanitize(doc), self.ignore)
+            except (IOError, ValueError, KeyError, IndexError, TypeError) as e:
+                raise TemplateError("Unable to read {0}: {1}".format(path, e))
+        return self.baselines[path]
+
+    def compare(self, cins):
+        """Returns (template entry, status, operations) for one inspect"""
+        entry = self.catalog.for_container({'Id': cins['Id'], 'Name': cins.get('Name')})
+        if entry is None:
+            return None, NO_TEMPLATE, []
+        ops = self.baseline(entry.path).compare(sanitize(cins))
+        return entry, DRIFTED if ops else IN_SYNC, ops
+
+    def check(self, asjson=False):
+        """Reports the drift of every selected container
+
+        Returns the number of containers that drifted or failed."""
+        cuids, errors = self.select()
+        start = time.time()
+        self.catalog.refresh()
+        inspects, inspecterrors = bulk.inspect_containers(self.c, cuids, self.workers)
+        errors.update(inspecterrors)
+        report = []
+        for cuid, cins in zip(cuids, inspects):
+            if cins is None:
+                continue
+            name = cins.get('Name', '').lstrip('/')
+            try:
+                entry, status, ops = self.compare(cins)
+            except TemplateError as e:
+                errors[cuid] = e
+                continue
+            report.append((cuid, name, entry.path if entry else None, status, ops))
+        elapsed = time.time() - start
+        if asjson:
+            entries = []
+            for row in report:
+                entries.append(dict(zip(('container', 'name', 'template', 'status', 'operations'), row)))
+            for failed, err in errors.items():
+                entries.append({'container': failed, 'status': 'failed', 'error': str(err)})
+            print json.dumps(entries, indent=2)
+        else:
+            self.printreport(report, errors, elapsed)
+        return len([r for r in report if r[3] == DRIFTED]) + len(errors)
+
+    def printreport(self, report, errors, elapsed):
+        print "{0:12} {1:24} {2:12} {3}".format("Container", "Name", "Result", "Template")
+        for cuid, name, path, status, ops in report:
+            print "{0:12} {1:24} {2:12} {3}".format(cuid[:12], name[:24], status, path or "")
+            for op in ops:
+                print "    {0}".format(diff.describe(op))
+        for cuid, err in errors.items():
+            print "{0:12} {1:24} {2:12} {3}".format(cuid[:12], "", "FAILED", str(err) or err.__class__.__name__)
+        counts = dict((status, len([r for r in report if r[3] == status]))
+                      for status in (IN_SYNC, DRIFTED, NO_TEMPLATE))
+        print ""
+        print "{0} in sync, {1} drifted, {2} without a template, {3} failed in {4:.2f}s".format(
+            counts[IN_SYNC], counts[DRIFTED], counts[NO_TEMPLATE], len(errors), elapsed)
+
+
+class KubeList(Batch):
+    """Exports the selected containers as one Kubernetes List of pods
+
+    Containers are inspected KUBE_CHUNK at a time and every pod is
+    written out as soon as it is rendered, so memory does not grow with
+    the number of containers. With merge, containers joined by links,
+    volumes-from or a container network share one pod. Those pods are
+    written once every container is rendered, only the rendered
+    containers are kept until then."""
+
+    def __init__(self, **kwargs):
+        Batch.__init__(self, **kwargs)
+        self.output = kwargs.get('output') or "-"
+        self.merge = kwargs.get('merge', False)
+        self.errors = {}
+        self.exported = 0
+
+    def rendered(self, cuids):
+        """Yields a Create for every container that could be inspected"""
+        for start in range(0, len(cuids), KUBE_CHUNK):
+            chunk = cuids[start:start + KUBE_CHUNK]
+            inspects, errors = bulk.inspect_containers(self.c, chunk, self.workers)
+            self.errors.update(errors)
+            for cuid, cins in zip(chunk, inspects):
+                if cins is not None:
+                    self.exported += 1
+                    yield Create(cuid=cuid, outfile=None, directory=self.directory, force=False,
+                                 containerindex=self.containerindex, snapshotindex=self.snapshotindex,
+                                 inspect=cins)
+
+    def requires(self, cins):
+        """Names or IDs of the containers cins links to, takes volumes from
+        or shares the network of"""
+        hostconfig = cins.get('HostConfig') or {}
+        names = set()
+        for link in hostconfig.get('Links') or []:
+            names.add(link.split(':')[0].lstrip('/'))
+        for volumes in hostconfig.get('VolumesFrom') or []:
+            names.add(volumes.split(':')[0].lstrip('/'))
+        mode = hostconfig.get('NetworkMode') or ""
+        if mode.startswith("container:"):
+            names.add(mode.split(':', 1)[1])
+        return names
+
+    def pods(self, cuids):
+        """Yields the pods of cuids, in order"""
+        if not self.merge:
+            for create in self.rendered(cuids):
+                container, vols = create.kube_container()
+                yield kube_pod(create.container_json['Name'], [container], vols)
+            return
+        # Union-find over the selected containers, a pod per set
+        parents = dict((cuid, cuid) for cuid in cuids)
+
+        def find(cuid):
+            while parents[cuid] != cuid:
+                parents[cuid] = parents[parents[cuid]]
+                cuid = parents[cuid]
+            return cuid
+        parts = {}
+        for create in self.rendered(cuids):
+            parts[create.cuid] = (create.container_json['Name'],) + create.kube_container()
+            for name in self.requires(create.container_json):
+                # Containers not selected, or gone, are left out
+                other = self.containerindex.lookup(name)
+                if other is not None and other['Id'] in parents:
+                    parents[find(other['Id'])] = find(create.cuid)
+        groups = OrderedDict()
+        for cuid in cuids:
+            if cuid in parts:
+                groups.setdefault(find(cuid), []).append(parts.pop(cuid))
+        for members in groups.values():
+            vols = []
+            seen = set()
+            for _, _, membervols in members:
+                for vol in membervols:
+                    if vol['name'] not in seen:
+                        seen.add(vol['name'])
+                        vols.append(vol)
+            # Named after the first container selected
+            yield kube_pod(members[0][0], [member for _, member, _ in members], vols)
+
+    def dump(self, pods, out):
+        """Writes pods to out as a List, one at a time, returns how many"""
+        out.write('{\n  "apiVersion": "v1beta1",\n  "kind": "List",\n  "items": [')
+        count = 0
+        for pod in pods:
+            out.write(",\n" if count else "\n")
+            out.write("\n".join("    " + line for line in json.dumps(pod, indent=2, sort_keys=True).splitlines()))
+            count += 1
+        out.write("\n  ]\n}\n")
+        return count
+
+    def export(self):
+        """Writes the List to the output file, or stdout for -
+
+        Progress goes to stderr, stdout may be the List. Returns the
+        number of containers that failed."""
+        cuids, errors = self.select()
+        self.errors.update(errors)
+        start = time.time()
+        if self.output == "-":
+            count = self.dump(self.pods(cuids), sys.stdout)
+            sys.stdout.flush()
+        else:
+            count = fileutil.atomic_stream(os.path.abspath(self.output), lambda out: self.dump(self.pods(cuids), out))
+        for cuid, err in self.errors.items():
+            sys.stderr.write("Unable to export {0}: {1}\n".format(cuid[:12], str(err) or err.__class__.__name__))
+        sys.stderr.write("{0} pods from {1} containers, {2} failed in {3:.2f}s{4}\n".format(
+            count, self.exported, len(self.errors), time.time() - start,
+            "" if self.output == "-" else ": " + self.output))
+        return len(self.errors)
 
 
 class List(object):
-    def __init__(self):
-        self.pattern = 'service|json$'
+    def __init__(self, **kwargs):
+        self.image = kwargs.get('image')
+        self.name = kwargs.get('name')
+        self.catalog = kwargs.get('catalog') or catalog.shared(TEMPLATE_DIRS)
 
     def list_all(self):
-        dirlist = [USER_TEMPLATE_DIR, SYSTEM_TEMPLATE_DIR]
-        files = self.metadata_files(dirlist)
+        self.catalog.refresh()
+        if self.image or self.name:
+            for entry in self.catalog.search(image=self.image, name=self.name):
+                print "{0:50} {1:30} {2}".format(entry.path, entry.image or "", entry.name or "")
+            return
+        files = self.metadata_files(TEMPLATE_DIRS)
         for f in files:
             print f
 
     def metadata_files(self, dirlist):
-        files = [d + f for d in dirlist for f in os.listdir(d) if re.search(self.pattern, f)]
-        return files
+        if dirlist != self.catalog.dirs:
+            return catalog.shared(dirlist).files()
+        return self.catalog.files()
 
 
 class Pull(object):
+    """Fetches template files over HTTP into a template directory
+
+    Files are streamed to a temporary file and renamed into place. The
+    ETag and Last-Modified of every fetched URL are kept in a cache file
+    in the directory, so fetching a URL again sends a conditional request
+    and an unchanged file is not downloaded again. A file fetched from
+    the same URL and not modified since may be replaced without force."""
+
     def __init__(self, **kwargs):
         self.force = kwargs['force']
-        self.directory = kwargs['directory']
+        self.directory = kwargs['directory'] or USER_TEMPLATE_DIR
         self.outfile = kwargs['outfile']
-        self.response = None
-
-    def get_url_filename(self):
-        import cgi
-        _, params = cgi.parse_header(self.response.headers.get('Content-Disposition', ''))
-        return params['filename']
-
-    @property
-    def outname(self):
-        filename = None
-        if self.outfile:
-            filename = self.outfile
-        else:
-            filename = self.get_url_filename()
-        if not self.directory:
-            return "{0}/{1}".format(USER_TEMPLATE_DIR, filename)
-        else:
-            return "{0}/{1}".format(self.directory, filename)
+        self.workers = kwargs.get('workers') or WORKERS
+        self.cachefile = os.path.join(self.directory, PULL_CACHE)
+        self._cache = None
+        self.lock = threading.Lock()
+
+    def get_url_filename(self, response, url):
+        _, params = cgi.parse_header(response.headers.get('Content-Disposition', ''))
+        return params.get('filename') or os.path.basename(urlparse.urlparse(url).path)
+
+    def outname(self, response, url):
+        filename = self.outfile or self.get_url_filename(response, url)
+        if not filename:
+            raise TemplateError("{0}: no file name in the URL, pass -n or --name".format(url))
+        return os.path.join(self.directory, os.path.basename(filename))
+
+    def loadcache(self):
+        with self.lock:
+            if self._cache is None:
+                try:
+                    with open(self.cachefile) as f:
+                        self._cache = json.load(f)
+                except (IOError, ValueError):
+                    self._cache = {}
+            return self._cache
+
+    def savecache(self):
+        try:
+            with self.lock:
+                data = json.dumps(self._cache, indent=2)
+            fileutil.atomic_write(self.cachefile, data)
+        except (IOError, OSError):
+            pass
+
+    def cachedpath(self, entry):
+        """Path of the file of a cache entry
+
+        Entries name the file relative to the directory, which may be
+        given differently, or relative to another working directory,
+        next time. Older entries hold a path, only its name is used."""
+        return os.path.join(self.directory, os.path.basename(entry['path']))
+
+    def fetched(self, url):
+        """The cache entry of url if its file is still as we wrote it"""
+        entry = self.loadcache().get(url)
+        if not entry:
+            return None
+        try:
+            st = os.stat(self.cachedpath(entry))
+        except (OSError, KeyError):
+            return None
+        if st.st_size != entry.get('size') or st.st_mtime != entry.get('mtime'):
+            return None
+        return entry
 
     def pull_url(self, url):
-        from urllib2 import Request, urlopen, URLError
-        req = Request(url)
+        """Fetches url, returns WRITTEN or UNCHANGED. Raises TemplateError"""
+        entry = self.fetched(url)
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
         try:
-            response = urlopen(req)
-        except URLError as e:
-            if hasattr(e, 'reason'):
-                print 'We failed to reach a server.'
-                print 'Reason: ', e.reason
-            elif hasattr(e, 'code'):
-                print 'The server couldn\'t fulfill the request.'
-                print 'Error code: ', e.code
-        else:
-            self.response = response
-            self.writeoutput()
-
-    @property
-    def outfileexists(self):
-        return os.path.isfile(self.outname)
-
-    def writeoutput(self):
-        if (not self.force) and (self.outfileexists):
-            print ("{0} already exists. Pass -f or --force to override".format(self.outname))
-            quit(1)
-        else:
-            with open(self.outname, "w") as outfile:
-                outfile.write(self.response.read())
-            outfile.closed
-            print self.outname
+            response = urllib2.urlopen(urllib2.Request(url, headers=headers), timeout=PULL_TIMEOUT)
+        except urllib2.HTTPError as e:
+            if e.code == 304 and entry is not None:
+                sys.stdout.write("{0} is unchanged\n".format(self.cachedpath(entry)))
+                return UNCHANGED
+            raise TemplateError("{0}: the server returned {1} {2}".format(url, e.code, e.msg))
+        except urllib2.URLError as e:
+            raise TemplateError("{0}: unable to reach the server: {1}".format(url, e.reason))
+        try:
+            outname = self.outname(response, url)
+            ours = entry is not None and self.cachedpath(entry) == outname
+            if (not self.force) and (not ours) and os.path.isfile(outname):
+                raise TemplateError("{0} already exists. Pass -f or --force to override".format(outname))
+            self.writeoutput(response, outname)
+        finally:
+            response.close()
+        st = os.stat(outname)
+        with self.lock:
+            self._cache[url] = {'path': os.path.basename(outname),
+                                'etag': response.headers.get('ETag'),
+                                'last_modified': response.headers.get('Last-Modified'),
+                                'size': st.st_size,
+                                'mtime': st.st_mtime}
+        sys.stdout.write(outname + "\n")
+        return WRITTEN
+
+    def pull_urls(self, urls):
+        """Fetches urls concurrently, returns the number that failed"""
+        if self.outfile and len(urls) > 1:
+            raise TemplateError("--name only applies to a single URL")
+        self.loadcache()
+        start = time.time()
+        results, errors = bulk.run(self.pull_url, urls, self.workers)
+        self.savecache()
+        for url, err in errors.items():
+            print err
+        if len(urls) > 1:
+            print "{0} written, {1} unchanged, {2} failed in {3:.2f}s".format(
+                results.count(WRITTEN), results.count(UNCHANGED), len(errors), time.time() - start)
+        return len(errors)
+
+    def writeoutput(self, response, outname):
+        """Streams response to outname through a temporary file"""
+        def copy(outfile):
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                outfile.write(chunk)
+        fileutil.atomic_stream(outname, copy)
@@ -0,0 +1,142 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Concurrent image pulls over the streaming pull API
+
+import sys
+import time
+from collections import OrderedDict
+from docker_utils import bulk, client, index, stream
+
+# Statuses sent for every progress tick, not worth a line each
+PROGRESS = ('Downloading', 'Extracting', 'Waiting')
+
+
+class PullError(Exception):
+    pass
+
+
+def reference(ref):
+    """Returns ref as repository:tag, so 'fedora' and 'fedora:latest' match"""
+    return "{0}:{1}".format(*index.split_tag(ref))
+
+
+class PullResult(object):
+    """Progress and outcome of pulling one image reference"""
+
+    def __init__(self, ref):
+        self.ref = ref
+        self.layers = OrderedDict()
+        self.status = None
+        self.error = None
+        self.started = None
+        self.elapsed = 0
+
+    @property
+    def bytes(self):
+        """Bytes downloaded so far, summed over layers"""
+        return sum(current for current, _ in self.layers.values())
+
+    def update(self, event):
+        """Applies one decoded progress event"""
+        if 'error' in event:
+            self.error = event['error']
+            raise PullError(event['error'])
+        self.status = event.get('status') or self.status
+        layer = event.get('id')
+        detail = event.get('progressDetail') or {}
+        if layer and self.status == 'Downloading' and 'current' in detail:
+            self.layers[layer] = (detail['current'], detail.get('total', -1))
+        elif layer and layer not in self.layers:
+            self.layers[layer] = (0, -1)
+
+
+class PullManager(object):
+    """Pulls image references on a bounded pool of worker threads
+
+    References are deduplicated, 'fedora' and 'fedora:latest' are pulled
+    once. Each pull is read as a stream and decoded event by event, the
+    response is never held whole."""
+
+    def __init__(self, c=None, workers=bulk.WORKERS, insecure_registry=True, verbose=True):
+        self.c = c or client.get_client()
+        self.workers = workers
+        self.insecure_registry = insecure_registry
+        self.verbose = verbose
+        self.results = OrderedDict()
+
+    def report(self, result, event):
+        if not self.verbose or event.get('status') in PROGRESS:
+            return
+        line = "{0}: {1}".format(result.ref, event.get('status') or event.get('error'))
+        if event.get('id') and event['id'] != result.ref:
+            line = "{0} {1}".format(line, event['id'])
+        # One write, so lines from concurrent pulls do not interleave
+        sys.stdout.write(line + "\n")
+
+    def pullone(self, ref):
+        result = self.results[ref]
+        repo, tag = index.split_tag(ref)
+        result.started = time.time()
+        try:
+            chunks = self.c.pull(repo, tag=tag, stream=True,
+                                 insecure_registry=self.insecure_registry)
+            for event in stream.iterjson(chunks):
+                self.report(result, event)
+                result.update(event)
+        except Exception as e:
+            result.error = result.error or str(e) or e.__class__.__name__
+            raise
+        finally:
+            result.elapsed = time.time() - result.started
+        return result
+
+    def pull(self, refs):
+        """Pulls every reference, returns (results, errors)
+
+        results maps each deduplicated reference to its PullResult, errors
+        maps the references that failed to the exception."""
+        refs = list(OrderedDict((reference(ref), None) for ref in refs))
+        for ref in refs:
+            self.results[ref] = PullResult(ref)
+        _, errors = bulk.run(self.pullone, refs, self.workers)
+        return OrderedDict((ref, self.results[ref]) for ref in refs), errors
+
+    def pull_missing(self, refs, imageindex=None):
+        """Pulls the references not present locally, see pull()
+
+        Invalidates the image index afterwards when anything was pulled."""
+        imageindex = imageindex or index.shared_images()
+        missing = [ref for ref in refs if ref and not imageindex.exists(ref)]
+        if not missing:
+            return OrderedDict(), {}
+        results, errors = self.pull(missing)
+        imageindex.invalidate()
+        return results, errors
+
+    def printsummary(self, results=None):
+        results = self.results if results is None else results
+        if not results:
+            return
+        print ""
+        print "{0:40} {1:>6} {2:>10} {3:>8} {4:>8}".format("Image", "Layers", "MB", "Seconds", "MB/s")
+        for ref, result in results.items():
+            mb = result.bytes / 1048576.0
+            rate = mb / result.elapsed if result.elapsed > 0 else 0
+            print "{0:40} {1:6} {2:10.1f} {3:8.2f} {4:8.1f}{5}".format(
+                ref[-40:], len(result.layers), mb, result.elapsed, rate,
+                "  FAILED" if result.error else "")
@@ -0,0 +1,122 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Handing a container-template command line to a running
+# `container-template serve`. Imports nothing that imports docker, so a
+# forwarded call starts fast.
+
+import errno
+import json
+import os
+import socket
+import stat
+import sys
+import tempfile
+
+# Overrides the socket path
+SOCKET_ENV = "CONTAINER_TEMPLATE_SOCKET"
+# trace.ENV; tracing is per process, a traced command runs here
+TRACE_ENV = "DOCKER_UTILS_TRACE"
+CONNECT_TIMEOUT = 1
+PROTOCOL = 1
+
+
+def socket_path():
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+    if os.getuid() == 0:
+        return "/var/run/container-template.sock"
+    base = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(base, "container-template-{0}.sock".format(os.getuid()))
+
+
+def request(argv):
+    return {'protocol': PROTOCOL,
+            'argv': argv,
+            'cwd': os.getcwd(),
+            'docker_host': os.environ.get('DOCKER_HOST')}
+
+
+def connect(path=None):
+    """Returns a socket connected to the serve process, or None
+
+    Only a socket owned by this user is trusted."""
+    path = path or socket_path()
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        return None
+    sock.settimeout(None)
+    return sock
+
+
+def _write(stream, data):
+    """Writes data to stdout or stderr, False once the reader went away,
+    e.g. container-template list | head"""
+    try:
+        stream.write(data.encode('utf-8'))
+        stream.flush()
+    except IOError as e:
+        if e.errno != errno.EPIPE:
+            raise
+        return False
+    return True
+
+
+def forward(argv, path=None):
+    """Runs argv on the serve process and prints its output
+
+    Returns the exit code, or None when no serve process is running or
+    it declined, e.g. for options that change the docker connection. The
+    caller then runs the command itself."""
+    if os.environ.get(TRACE_ENV):
+        return None
+    sock = connect(path)
+    if sock is None:
+        return None
+    try:
+        sock.sendall(json.dumps(request(argv)) + "\n")
+        replies = sock.makefile('r')
+        for line in replies:
+            reply = json.loads(line)
+            if 'out' in reply or 'err' in reply:
+                stream = sys.stdout if 'out' in reply else sys.stderr
+                if not _write(stream, reply.get('out', reply.get('err'))):
+                    # Nothing left to print to, closing stops the server
+                    # writing to us
+                    return 1
+            elif 'exit' in reply:
+                return reply['exit']
+            elif 'declined' in reply:
+                return None
+    except (socket.error, ValueError) as e:
+        sys.stderr.write("container-template serve failed: {0}\n".format(e))
+        return 1
+    finally:
+        sock.close()
+    # The command may have run, running it again here is not safe
+    sys.stderr.write("container-template serve closed the connection\n")
+    return 1
@@ -0,0 +1,194 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# `container-template serve`: runs forwarded command lines in one long
+# lived process, against a warm client, indexes and template catalog
+
+import json
+import os
+import signal
+import socket
+import SocketServer
+import sys
+import threading
+import traceback
+from docker_utils import catalog, client, events, index, metadata, remote
+
+# Seconds between checks that the events stream is still alive
+WATCH_TIMEOUT = 60
+
+
+class Output(object):
+    """File-like object sending what is written to the client, one frame per write"""
+
+    def __init__(self, wfile, key, lock):
+        self.wfile = wfile
+        self.key = key
+        self.lock = lock
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.decode('utf-8', 'replace')
+        with self.lock:
+            self.wfile.write(json.dumps({self.key: data}) + "\n")
+            self.wfile.flush()
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class TemplateService(object):
+    """Runs command lines one at a time, with their output sent back
+
+    parse(argv) returns the arguments dispatch() takes, forwardable()
+    takes the same and tells whether the command may run here. The
+    container and image indexes and the template catalog are shared by
+    every command, the indexes are dropped whenever the events stream
+    reports a change.
+
+    Commands print to sys.stdout and sys.stderr throughout docker_utils,
+    so execute() points both at the caller for the length of a command.
+    That is why commands never overlap: everything the process prints
+    meanwhile, from any thread, goes to the one caller. The threads the
+    server runs itself do not print."""
+
+    def __init__(self, parse, dispatch, forwardable):
+        self.parse = parse
+        self.dispatch = dispatch
+        self.forwardable = forwardable
+        self.lock = threading.Lock()
+        self.model = None
+
+    def warm(self):
+        index.shared_containers().refresh()
+        index.shared_images().refresh()
+        catalog.shared(metadata.TEMPLATE_DIRS).refresh()
+        self.model = events.HostModel(client.get_client())
+        self.model.start()
+        watcher = threading.Thread(target=self.watch)
+        watcher.daemon = True
+        watcher.start()
+
+    def watch(self):
+        generation = self.model.generation
+        while True:
+            changed = self.model.wait(generation, WATCH_TIMEOUT)
+            if changed != generation:
+                generation = changed
+                # Fetched again by the next command that needs them
+                index.shared_containers().invalidate()
+                index.shared_images().invalidate()
+
+    def declines(self, req):
+        if req.get('protocol') != remote.PROTOCOL:
+            return "protocol {0}".format(req.get('protocol'))
+        if (req.get('docker_host') or client.BASE_URL) != client.base_url():
+            return "another docker host"
+        return None
+
+    def execute(self, req, wfile):
+        """Runs one request, holding self.lock while stdout and stderr
+        are the caller's"""
+        wlock = threading.Lock()
+        reason = self.declines(req)
+        if reason is not None:
+            wfile.write(json.dumps({'declined': reason}) + "\n")
+            return
+        with self.lock:
+            saved = sys.stdout, sys.stderr
+            cwd = os.getcwd()
+            sys.stdout = Output(wfile, 'out', wlock)
+            sys.stderr = Output(wfile, 'err', wlock)
+            code = 0
+            try:
+                os.chdir(req['cwd'])
+                parsed = self.parse(req['argv'])
+                if not self.forwardable(*parsed):
+                    with wlock:
+                        wfile.write(json.dumps({'declined': "not forwardable"}) + "\n")
+                    return
+                self.dispatch(*parsed)
+            except SystemExit as e:
+                code = e.code
+                if code is not None and not isinstance(code, int):
+                    sys.stderr.write("{0}\n".format(code))
+                    code = 1
+            except Exception:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout, sys.stderr = saved
+                os.chdir(cwd)
+        with wlock:
+            wfile.write(json.dumps({'exit': code or 0}) + "\n")
+
+
+class Handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        try:
+            req = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+        try:
+            self.server.service.execute(req, self.wfile)
+        except IOError:
+            # The client went away
+            pass
+
+    def finish(self):
+        try:
+            SocketServer.StreamRequestHandler.finish(self)
+        except socket.error:
+            # The client went away before the reply was flushed
+            self.rfile.close()
+
+
+class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(service, path=None):
+    """Answers on path, the per user socket by default, until interrupted"""
+    path = path or remote.socket_path()
+    if os.path.exists(path):
+        running = remote.connect(path)
+        if running is not None:
+            running.close()
+            raise metadata.TemplateError("container-template serve is already running on {0}".format(path))
+        os.unlink(path)
+    # Only this user may connect
+    umask = os.umask(0077)
+    try:
+        server = Server(path, Handler)
+    finally:
+        os.umask(umask)
+    server.service = service
+    # Stopped by a service manager, clean up as for ^C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        service.warm()
+        print "Serving on {0}".format(path)
+        sys.stdout.flush()
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
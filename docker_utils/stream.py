@@ -0,0 +1,48 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Helpers for the streaming (chunked) docker API endpoints
+
+import json
+
+_decoder = json.JSONDecoder()
+
+
+def iterjson(chunks):
+    """Yields JSON objects from an iterable of text chunks
+
+    Objects may be split across chunks or share one; only the unparsed
+    tail is kept between chunks."""
+    buf = ""
+    for chunk in chunks:
+        if isinstance(chunk, (dict, list)):
+            # docker-py already decoded it
+            yield chunk
+            continue
+        buf += chunk
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos == len(buf):
+                break
+            try:
+                obj, pos = _decoder.raw_decode(buf, pos)
+            except ValueError:
+                break
+            yield obj
+        buf = buf[pos:]
@@ -0,0 +1,153 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Concurrent, dependency aware removal of containers and images
+
+import docker
+from docker_utils import bulk
+
+
+def isrunning(container):
+    """True for a running container, given a list entry or an inspect"""
+    if 'State' in container and isinstance(container['State'], dict):
+        return container['State'].get('Running') is True
+    return (container.get('Status') or "").startswith('Up')
+
+
+def notfound(e):
+    return isinstance(e, docker.errors.APIError) and \
+        e.response is not None and e.response.status_code == 404
+
+
+class Plan(object):
+    def __init__(self, stop, remove, waves, children=None):
+        self.stop = stop
+        self.remove = remove
+        self.waves = waves
+        # Image ID -> IDs of its children in the plan
+        self.children = children or {}
+
+    @property
+    def images(self):
+        return [iid for wave in self.waves for iid in wave]
+
+
+class Teardown(object):
+    """Stops and removes containers, then removes images in waves
+
+    Every stage runs on a pool of workers threads. Images are removed in
+    waves: an image is only removed after every child of it in the plan
+    is gone. An image with a child that could not be removed is skipped."""
+
+    def __init__(self, c, workers=bulk.WORKERS, stop_timeout=0):
+        self.c = c
+        self.workers = workers
+        self.stop_timeout = stop_timeout
+        self.stages = bulk.Stages(workers)
+        self.removed_images = set()
+        self.skipped_images = set()
+
+    def plan(self, containers, graph, iids):
+        """Builds a Plan for containers and iids plus their descendants"""
+        order = graph.deletion_plan(iids)
+        inplan = set(order)
+        height = {}
+        children = {}
+        for iid in order:
+            # deletion_plan lists children before their parent
+            children[iid] = [child for child in graph.children.get(iid, []) if child in inplan]
+            height[iid] = max([height[child] + 1 for child in children[iid]] or [0])
+        waves = [[] for _ in range(max(height.values()) + 1 if height else 0)]
+        for iid in order:
+            waves[height[iid]].append(iid)
+        return Plan([c['Id'] for c in containers if isrunning(c)],
+                    [c['Id'] for c in containers],
+                    waves, children)
+
+    def printplan(self, plan):
+        print "Would stop {0} container(s)".format(len(plan.stop))
+        for cid in plan.stop:
+            print "  stop {0}".format(cid[:12])
+        print "Would remove {0} container(s)".format(len(plan.remove))
+        for cid in plan.remove:
+            print "  remove {0}".format(cid[:12])
+        print "Would remove {0} image(s) in {1} wave(s)".format(len(plan.images), len(plan.waves))
+        for num, wave in enumerate(plan.waves):
+            for iid in wave:
+                print "  wave {0}: {1}".format(num, iid[:12])
+
+    def stage(self, name, func, items, label=None):
+        _, errors = self.stages.run(name, func, items, label, key=lambda iid: iid[:12])
+        return errors
+
+    def stopcontainer(self, cid):
+        self.c.stop(cid, timeout=self.stop_timeout)
+
+    def removecontainer(self, cid):
+        try:
+            self.c.remove_container(cid, v=False, link=False)
+        except docker.errors.APIError as e:
+            if not notfound(e):
+                raise
+
+    def removeimage(self, iid):
+        if iid in self.removed_images:
+            return
+        try:
+            result = self.c.remove_image(iid, force=True)
+        except docker.errors.APIError as e:
+            # Untagged parents go with their last child
+            if not notfound(e):
+                raise
+            result = None
+        self.removed_images.add(iid)
+        for r in result or []:
+            if 'Deleted' in r:
+                self.removed_images.add(r['Deleted'])
+
+    def execute(self, plan):
+        """Runs the plan, returns the number of failed operations
+
+        Images left in place because a child could not be removed are
+        not failures, they are kept in skipped_images."""
+        self.stages = bulk.Stages(self.workers)
+        self.removed_images = set()
+        self.skipped_images = set()
+        # Images that failed or were skipped, their parents have to stay
+        kept = set()
+        failed = 0
+        if plan.stop:
+            print "Stopping {0} container(s)...".format(len(plan.stop))
+            failed += len(self.stage("stop", self.stopcontainer, plan.stop))
+        if plan.remove:
+            print "Removing {0} container(s)...".format(len(plan.remove))
+            failed += len(self.stage("remove", self.removecontainer, plan.remove))
+        for num, wave in enumerate(plan.waves):
+            skip = [iid for iid in wave if kept.intersection(plan.children.get(iid, []))]
+            for iid in skip:
+                print "Skipping image {0}, a child of it could not be removed".format(iid[:12])
+            self.skipped_images.update(skip)
+            kept.update(skip)
+            wave = [iid for iid in wave if iid not in kept]
+            print "Removing {0} image(s), wave {1} of {2}...".format(len(wave), num + 1, len(plan.waves))
+            errors = self.stage("remove image", self.removeimage, wave, "image wave {0}".format(num + 1))
+            kept.update(iid for iid in wave if iid[:12] in errors)
+            failed += len(errors)
+        return failed
+
+    def printsummary(self):
+        self.stages.printsummary()
@@ -0,0 +1,91 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Reading template files and manifests, without docker
+
+import json
+import os
+from collections import OrderedDict
+
+TEMPLATE = "template"
+POD = "pod"
+UNIT = "unit"
+
+
+def filekind(filename):
+    """Returns the kind of file a template directory entry is, or None"""
+    if filename.startswith('.'):
+        return None
+    if filename.endswith('-pod.json'):
+        return POD
+    if filename.endswith('.json'):
+        return TEMPLATE
+    if filename.endswith('.service'):
+        return UNIT
+    return None
+
+
+class TemplateError(Exception):
+    pass
+
+
+def load_template(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError) as e:
+        raise TemplateError("Unable to read {0}: {1}".format(path, e))
+
+
+def is_manifest(data):
+    """A manifest is a JSON list of template paths"""
+    return isinstance(data, list) and all(isinstance(entry, basestring) for entry in data)
+
+
+def expand_templates(paths, errors=None):
+    """Returns an OrderedDict of real path to loaded template
+
+    paths may name template files, directories of templates (every *.json
+    but the -pod.json kubernetes files) and manifests, whose entries are
+    relative to the manifest. A file reached twice is loaded once. Files
+    that fail to load raise TemplateError, or are recorded in errors."""
+    templates = OrderedDict()
+    seen = set()
+    pending = list(reversed(paths))
+    while pending:
+        path = os.path.realpath(pending.pop())
+        if path in seen:
+            continue
+        seen.add(path)
+        if os.path.isdir(path):
+            names = [name for name in sorted(os.listdir(path))
+                     if filekind(name) == TEMPLATE]
+            pending.extend(os.path.join(path, name) for name in reversed(names))
+            continue
+        try:
+            data = load_template(path)
+        except TemplateError as e:
+            if errors is None:
+                raise
+            errors[path] = e
+            continue
+        if is_manifest(data):
+            base = os.path.dirname(path)
+            pending.extend(os.path.join(base, entry) for entry in reversed(data))
+        else:
+            templates[path] = data
+    return templates
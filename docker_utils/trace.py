@@ -0,0 +1,256 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Timing of docker API calls and file writes, off unless enabled
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import types
+from collections import OrderedDict
+import docker
+
+# "1" prints a summary at exit, anything else is also a trace file to write
+ENV = "DOCKER_UTILS_TRACE"
+# Frames in these files are skipped when looking for the caller
+_INTERNAL = ('trace.py', 'client.py', os.sep + 'docker' + os.sep, os.sep + 'requests' + os.sep)
+
+
+class Span(object):
+    """One timed call: a docker API call, a request or a file write"""
+
+    def __init__(self, name, category, caller=None, detail=None):
+        self.name = name
+        self.category = category
+        self.caller = caller
+        self.detail = detail
+        self.thread = threading.current_thread().ident
+        self.start = time.time()
+        self.duration = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.error = None
+
+    def finish(self, error=None):
+        self.duration = time.time() - self.start
+        if error is not None:
+            self.error = error.__class__.__name__
+
+
+class _NoSpan(object):
+    """Stands in for a Span while tracing is off"""
+    bytes_in = 0
+    bytes_out = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_nospan = _NoSpan()
+
+
+def percentile(durations, pct):
+    """Nearest rank percentile of a sorted list"""
+    if not durations:
+        return 0
+    return durations[min(len(durations) - 1, int(len(durations) * pct / 100.0))]
+
+
+class Recorder(object):
+    """Collects the spans of one run"""
+
+    def __init__(self):
+        self.spans = []
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def current(self):
+        """The API call open on this thread, or None"""
+        return getattr(self.local, 'span', None)
+
+    def add(self, span):
+        with self.lock:
+            self.spans.append(span)
+
+    def summary(self):
+        """Returns [(name, category, count, total, p50, p99, bytes)], slowest total first"""
+        groups = OrderedDict()
+        with self.lock:
+            spans = list(self.spans)
+        for span in spans:
+            groups.setdefault((span.name, span.category), []).append(span)
+        rows = []
+        for (name, category), found in groups.items():
+            durations = sorted(span.duration for span in found)
+            rows.append((name, category, len(found), sum(durations), percentile(durations, 50),
+                         percentile(durations, 99), sum(span.bytes_in + span.bytes_out for span in found)))
+        return sorted(rows, key=lambda row: row[3], reverse=True)
+
+    def printsummary(self, out=None):
+        out = out or sys.stderr
+        rows = self.summary()
+        out.write("\n{0:36} {1:>6} {2:>9} {3:>8} {4:>8} {5:>10}\n".format(
+            "Call", "Count", "Total ms", "p50 ms", "p99 ms", "KB"))
+        for name, category, count, total, p50, p99, size in rows:
+            out.write("{0:36} {1:6} {2:9.1f} {3:8.2f} {4:8.2f} {5:10.1f}\n".format(
+                name[:36], count, total * 1000, p50 * 1000, p99 * 1000, size / 1024.0))
+        out.write("{0} calls in {1:.2f}s\n".format(sum(row[2] for row in rows), time.time() - self.started))
+
+    def writechrome(self, path):
+        """Writes the spans in the Chrome trace event format, for chrome://tracing"""
+        pid = os.getpid()
+        with self.lock:
+            spans = list(self.spans)
+        events = []
+        for span in spans:
+            args = {'bytes_in': span.bytes_in, 'bytes_out': span.bytes_out}
+            if span.caller:
+                args['caller'] = span.caller
+            if span.detail:
+                args['detail'] = span.detail
+            if span.error:
+                args['error'] = span.error
+            events.append({'name': span.name, 'cat': span.category, 'ph': 'X', 'pid': pid, 'tid': span.thread,
+                           'ts': int((span.start - self.started) * 1000000),
+                           'dur': int(span.duration * 1000000), 'args': args})
+        with open(path, "w") as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+_recorder = None
+
+
+def enabled():
+    return _recorder is not None
+
+
+def enable(path=None):
+    """Starts recording. The summary is printed at exit, and the Chrome
+    trace written to path when one is given"""
+    global _recorder
+    if _recorder is not None:
+        return _recorder
+    _recorder = Recorder()
+
+    def report():
+        _recorder.printsummary()
+        if path:
+            _recorder.writechrome(path)
+            sys.stderr.write("Trace written to {0}\n".format(path))
+    atexit.register(report)
+    return _recorder
+
+
+def enable_from_env():
+    value = os.environ.get(ENV)
+    if value:
+        enable(None if value == "1" else value)
+
+
+def caller():
+    """file:line function of the first frame outside docker and this package's plumbing"""
+    frame = sys._getframe(2)
+    while frame is not None and any(part in frame.f_code.co_filename for part in _INTERNAL):
+        frame = frame.f_back
+    if frame is None:
+        return None
+    return "{0}:{1} {2}".format(os.path.basename(frame.f_code.co_filename), frame.f_lineno, frame.f_code.co_name)
+
+
+def span(name, category="file", detail=None):
+    """Context manager timing a block, e.g. a file write with its path as detail
+
+    Set bytes_out on the span it returns. A no-op while tracing is off."""
+    if _recorder is None:
+        return _nospan
+    return _Timed(Span(name, category, caller(), detail))
+
+
+class _Timed(object):
+    def __init__(self, span):
+        self.span = span
+
+    def __enter__(self):
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.finish(exc)
+        _recorder.add(self.span)
+        return False
+
+
+def _traced(name, method):
+    def call(*args, **kwargs):
+        # Only the outermost call is recorded, create_container calls
+        # create_container_from_config for instance
+        if _recorder.current() is not None:
+            return method(*args, **kwargs)
+        span = Span(name, "api", caller())
+        _recorder.local.span = span
+        error = None
+        try:
+            return method(*args, **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _recorder.local.span = None
+            span.finish(error)
+            _recorder.add(span)
+    return call
+
+
+def _tracedsend(send):
+    def call(request, **kwargs):
+        outer = _recorder.current()
+        # A request made outside the client methods, e.g. the log stream
+        span = outer or Span("{0} {1}".format(request.method, request.path_url.split('?')[0]), "http", caller())
+        response = send(request, **kwargs)
+        if request.body:
+            span.bytes_out += len(request.body)
+        if kwargs.get('stream'):
+            span.bytes_in += int(response.headers.get('Content-Length') or 0)
+        else:
+            span.bytes_in += len(response.content)
+        if outer is None:
+            span.finish()
+            _recorder.add(span)
+        return response
+    return call
+
+
+def instrument(c):
+    """Times every public docker.Client method called on c, and counts
+    the bytes sent and received. Streams are timed until the call
+    returns, not until they are read."""
+    if _recorder is None:
+        return c
+    for name, func in vars(docker.Client).items():
+        if not name.startswith('_') and isinstance(func, types.FunctionType):
+            setattr(c, name, _traced(name, getattr(c, name)))
+    c.send = _tracedsend(c.send)
+    return c
+
+
+enable_from_env()
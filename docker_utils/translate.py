@@ -0,0 +1,242 @@
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Translation of a saved inspect into create_container and start kwargs
+
+from docker_utils.metadata import TemplateError
+
+
+class Field(object):
+    """One value read from an inspect
+
+    paths are dotted inspect paths tried in order, the first one present
+    and not null wins. List newer API layouts first, e.g. HostConfig.Memory
+    (1.18) before Config.Memory. create and start name the docker-py
+    keyword the value is passed as, flag the docker run option."""
+
+    def __init__(self, attr, paths, default=None, create=None, start=None, flag=None):
+        self.attr = attr
+        self.paths = paths
+        self.default = default
+        self.create = create
+        self.start = start
+        self.flag = flag
+
+
+FIELDS = (
+    Field('image', ['Config.Image'], create='image', flag='image'),
+    Field('cmd', ['Config.Cmd'], create='command'),
+    Field('hostname', ['Config.Hostname'], create='hostname', flag='hostname'),
+    Field('user', ['Config.User'], create='user', flag='user'),
+    Field('detach', [], default=False, create='detach'),
+    Field('stdin_open', ['Config.OpenStdin'], default=False, create='stdin_open', flag='interactive'),
+    Field('tty', ['Config.Tty'], default=False, create='tty', flag='tty'),
+    Field('mem_limit', ['HostConfig.Memory', 'Config.Memory'], default=0, create='mem_limit', flag='memory'),
+    Field('memswap_limit', ['HostConfig.MemorySwap', 'Config.MemorySwap'], default=0,
+          create='memswap_limit', flag='memory-swap'),
+    Field('environment', ['Config.Env'], create='environment', flag='env'),
+    Field('dns', ['HostConfig.Dns', 'Config.Dns'], create='dns', start='dns', flag='dns'),
+    Field('network_disabled', ['Config.NetworkDisabled'], default=False, create='network_disabled'),
+    Field('name', ['Name'], create='name', flag='name'),
+    Field('entrypoint', ['Config.Entrypoint'], create='entrypoint', flag='entrypoint'),
+    Field('cpu_shares', ['HostConfig.CpuShares', 'Config.CpuShares'], create='cpu_shares', flag='cpu-shares'),
+    Field('cpuset', ['HostConfig.CpusetCpus', 'HostConfig.Cpuset', 'Config.Cpuset'],
+          create='cpuset', flag='cpuset'),
+    Field('working_dir', ['Config.WorkingDir'], create='working_dir', flag='workdir'),
+    Field('domainname', ['Config.Domainname'], create='domainname'),
+    Field('lxc_conf', ['HostConfig.LxcConf'], start='lxc_conf', flag='lxc-conf'),
+    Field('publish_all_ports', ['HostConfig.PublishAllPorts'], default=False,
+          start='publish_all_ports', flag='publish-all'),
+    Field('privileged', ['HostConfig.Privileged'], default=False, start='privileged', flag='privileged'),
+    Field('dns_search', ['HostConfig.DnsSearch'], start='dns_search', flag='dns-search'),
+    # volumes_from only goes to start(), create rejects it since API 1.10
+    Field('volumes_from', ['HostConfig.VolumesFrom', 'Config.VolumesFrom'],
+          start='volumes_from', flag='volumes-from'),
+    Field('network_mode', ['HostConfig.NetworkMode'], start='network_mode', flag='net'),
+    Field('restart_policy', ['HostConfig.RestartPolicy'], start='restart_policy'),
+    Field('cap_add', ['HostConfig.CapAdd'], start='cap_add', flag='cap-add'),
+    Field('cap_drop', ['HostConfig.CapDrop'], start='cap_drop', flag='cap-drop'),
+    Field('cidfile', ['HostConfig.ContainerIDFile'], flag='cidfile'),
+    # Raw values the derived kwargs below are built from
+    Field('links', ['HostConfig.Links'], flag='link'),
+    Field('binds', ['HostConfig.Binds'], flag='volume'),
+    Field('ports', ['NetworkSettings.Ports']),
+    Field('port_bindings', ['HostConfig.PortBindings']),
+    Field('exposed_ports', ['Config.ExposedPorts']),
+    Field('volumes', ['Volumes', 'Config.Volumes']),
+    Field('volumesrw', ['VolumesRW']),
+    Field('mounts', ['Mounts']),
+)
+
+
+def links(values):
+    # inspect gives "/name:/container/alias", docker-py wants (name, alias)
+    if not values['links']:
+        return None
+    linklist = []
+    for link in values['links']:
+        name, alias = link.split(':', 1)
+        linklist.append((name.lstrip('/'), alias.rsplit('/', 1)[-1]))
+    return linklist
+
+
+def portlist(values):
+    """Every exposed or published port as (port, protocol)"""
+    found = set()
+    for table in (values['exposed_ports'], values['port_bindings'], values['ports']):
+        for key in table or {}:
+            port, _, proto = key.partition('/')
+            found.add((int(port), proto or 'tcp'))
+    return sorted(found) or None
+
+
+def portbindings(values):
+    """Host bindings, as configured or else as seen on the running container"""
+    table = values['port_bindings'] or values['ports']
+    if not table:
+        return None
+    bindings = {}
+    for key, hosts in table.iteritems():
+        port = int(key.split('/')[0])
+        if type(hosts) != list:
+            bindings[port] = hosts
+            continue
+        hosts = [(h.get('HostIp') or '', int(h['HostPort'])) for h in hosts if h.get('HostPort')]
+        bindings[port] = hosts[0] if len(hosts) == 1 else (hosts or None)
+    return bindings
+
+
+def volumelist(values):
+    if values['mounts']:
+        return [m['Destination'] for m in values['mounts']]
+    if type(values['volumes']) is not dict:
+        return None
+    return values['volumes'].keys()
+
+
+def volumebinds(values):
+    if values['mounts']:
+        return dict((m['Source'], {'bind': m['Destination'], 'ro': not m.get('RW', True)})
+                    for m in values['mounts'] if m.get('Source'))
+    volumes = values['volumes']
+    volumesrw = values['volumesrw'] or {}
+    if type(volumes) is not dict:
+        return None
+    binds = {}
+    for path, hostpath in volumes.iteritems():
+        if path in volumesrw:
+            binds[hostpath] = {'bind': path, 'ro': volumesrw[path] is not True}
+    return binds
+
+
+# Kwargs computed from several fields: (create kwarg, start kwarg, function)
+DERIVED = (
+    ('ports', None, portlist),
+    (None, 'port_bindings', portbindings),
+    ('volumes', None, volumelist),
+    (None, 'binds', volumebinds),
+    (None, 'links', links),
+)
+
+
+def _getter(path):
+    keys = tuple(path.split('.'))
+
+    def get(doc):
+        try:
+            for key in keys:
+                doc = doc[key]
+        except (KeyError, TypeError):
+            return None
+        return doc
+    return get
+
+
+class Translation(object):
+    """An inspect read through the field table
+
+    Every Field.attr is an attribute, create and start hold the kwargs
+    for create_container() and start()."""
+
+    def __init__(self, values, create, start):
+        self.__dict__.update(values)
+        self.values = values
+        self.create = create
+        self.start = start
+
+
+class Translator(object):
+    """The field table compiled once: paths split, getters built and
+    fields grouped, so translating an inspect is one pass over it"""
+
+    def __init__(self, fields=FIELDS, derived=DERIVED):
+        self.fields = [(f.attr, [_getter(p) for p in f.paths], f.default, f.create, f.start)
+                       for f in fields]
+        self.derived = derived
+        self.keymap = {}
+        for f in fields:
+            if f.flag:
+                for path in f.paths:
+                    self.keymap[path.rsplit('.', 1)[-1]] = f.flag
+
+    def translate(self, params):
+        """Returns the Translation of a template, a saved [inspect, ...] list"""
+        if not isinstance(params, list) or not params or not isinstance(params[0], dict):
+            raise TemplateError("Not a container template")
+        doc = params[0]
+        values = {}
+        create = {}
+        start = {}
+        for attr, getters, default, ckey, skey in self.fields:
+            value = None
+            for get in getters:
+                value = get(doc)
+                if value is not None:
+                    break
+            if value is None:
+                value = default
+            values[attr] = value
+            if value is not None:
+                if ckey:
+                    create[ckey] = value
+                if skey:
+                    start[skey] = value
+        if not values['image']:
+            raise TemplateError("Template has no Config.Image")
+        for ckey, skey, func in self.derived:
+            try:
+                value = func(values)
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                raise TemplateError("Unable to read {0}: {1}".format(ckey or skey, e))
+            if value is not None:
+                if ckey:
+                    create[ckey] = value
+                if skey:
+                    start[skey] = value
+        return Translation(values, create, start)
+
+
+_translator = Translator()
+
+
+def translate(params):
+    return _translator.translate(params)
+
+
+def cli_keymap():
+    """Maps inspect keys to docker run options, e.g. Memory to memory"""
+    return dict(_translator.keymap)
@@ -1,47 +1,69 @@
-import json
+#!/usr/bin/env python
+# Copyright (C) 2014 Brent Baude <bbaude@redhat.com>, Aaron Weitekamp <aweiteka@redhat.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
 import argparse
+import json
+import sys
+from collections import OrderedDict
+from docker_utils import diff, templates
 
-parser = argparse.ArgumentParser()
-parser.add_argument("-b", "--base", help="basefile")
-parser.add_argument("-d", "--delta", help="deltafile")
-args = parser.parse_args()
-fname1 = args.base
-fname2 = args.delta
-
-file1 = json.loads(open(fname1).read())
-file2 = json.loads(open(fname2).read())
-
-mydict = file1[0]
-mydict2 = file2[0]
-
-def iterkey(key, thedict):
-    global mydict
-    for k,v in thedict.iteritems():
-        if mydict[key][k] != mydict2[key][k]:
-            if mydict[key][k] == "":
-                dict1val = "None"
-            else:
-                dict1val = mydict[key][k]
-            if mydict2[key][k] == "":
-                dict2val = "None"
-            else:
-                dict2val = mydict2[key][k]
-            print "{0} {1} vs {2}".format(k, dict1val, dict2val)
-
-for k, v in mydict.iteritems():
-    if type(mydict[k]) == dict:
-        iterkey(k, mydict[k])
-    else:
-        if mydict[k] != mydict2[k]:
-            if mydict[k] == "":
-                dict1val = "None"
-            else:
-                dict1val = mydict[k]
-            if mydict2[k] == "":
-                dict2val = "None"
-            else:
-                dict2val = mydict2[k]
-            print "{0} {1} vs {2}".format(k, dict1val, dict2val)
 
+def main():
+    """Compares a base template with one or more others"""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--base", required=True, help="basefile")
+    parser.add_argument("-d", "--delta", required=True, nargs='+',
+                        help="deltafile. Several files, directories of templates and manifests may be given.")
+    parser.add_argument("-i", "--ignore", action='append', default=[],
+                        help="JSON pointer to leave out of the comparison, e.g. /0/State or /*/Config/Hostname. "
+                             "May be repeated.")
+    parser.add_argument("--json", action='store_true',
+                        help="Print the differences as JSON patch style operations")
+    args = parser.parse_args()
+
+    errors = OrderedDict()
+    try:
+        base = diff.Baseline(templates.load_template(args.base), args.ignore)
+        deltas = templates.expand_templates(args.delta, errors)
+    except templates.TemplateError as e:
+        print e
+        sys.exit(2)
+    results = base.compare_many(deltas.items())
+
+    if args.json:
+        print json.dumps(OrderedDict(results), indent=2)
+    else:
+        several = len(results) > 1
+        for path, ops in results:
+            if several and ops:
+                print "{0}:".format(path)
+            for op in ops:
+                print "{0}{1}".format("  " if several else "", diff.describe(op))
+        if several:
+            differ = len([ops for _, ops in results if ops])
+            print "{0} of {1} templates differ from {2}".format(differ, len(results), args.base)
+    for path, err in errors.items():
+        print "{0}: {1}".format(path, err)
+    if errors:
+        sys.exit(2)
+    sys.exit(1 if any(ops for _, ops in results) else 0)
 
 
+if __name__ == '__main__':
+    main()